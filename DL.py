@@ -2,10 +2,14 @@ import subprocess
 import time
 import re
 import os
-import threading
 import socket
+import asyncio
+import contextlib
 from urllib.parse import urlparse
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor
+import autotune
+import livedb
+import tsprobe
 
 # ==================== 配置参数（适配仓库根目录iptvz + FFmpeg，无iptv子文件夹） ====================
 # 自动获取脚本所在的仓库根目录（iptvz），无需手动修改，跨环境兼容
@@ -18,8 +22,36 @@ RETRY_COUNT = 1         # 重试次数
 # 建议：将ffmpeg文件夹放到仓库根目录，路径就是 ./ffmpeg/bin/ffprobe，云端/本地都能识别
 FFPROBE_PATH = os.path.join(BASE_DIR, "ffmpeg/bin/ffprobe")
 TOTAL_TIMEOUT = 15      # 总超时时间（秒）
-# 进程池大小（按需调整：1核设2，4核设4，8核设8，云端/本地通用）
-PROCESS_POOL_SIZE = 4   
+# 同时运行的ffprobe进程起步数（默认CPU核数）；由一个asyncio事件循环直接管理，不再经过进程池和线程
+PROCESS_POOL_SIZE = os.cpu_count() or 1
+# ffprobe并发上限：起步后由AIMD控制器按系统负载自动增减
+MAX_POOL_SIZE = int(os.environ.get("DL_MAX_POOL_SIZE", str((os.cpu_count() or 1) * 8)))
+FRAME_GAP = 5           # 超过该时长（秒）没有新帧即判为断流
+# 自适应超时：读取zubo.py/iptv.py保存在ip/live.db的网段连接耗时，按地址缩短ffprobe的网络超时
+# 死主机不再白等满TEST_DURATION；拉流前udpxy要先加入组播，超时不低于STREAM_TIMEOUT_FLOOR
+ADAPTIVE_TIMEOUT = os.environ.get("DL_ADAPTIVE_TIMEOUT", "1") == "1"
+STREAM_TIMEOUT_FLOOR = 3
+# 检测引擎：native 为http地址直接读TS流、逐包分析同步/连续计数/PCR/PTS（tsprobe.py），不启动ffprobe进程，
+# udp/rtp地址直接加入组播组收包；DL_CHECK_ENGINE=ffprobe 时全部沿用ffprobe检测
+CHECK_ENGINE = os.environ.get("DL_CHECK_ENGINE", "native")
+# 组播直收：部署在运营商网络内时设DL_MULTICAST=1，udpxy地址（http://主机/rtp/组:端口）也直接加入组播组检测，
+# 同一组播组只收一次；DL_MULTICAST_IFACE为接收组播的本机网卡地址
+MULTICAST_DIRECT = os.environ.get("DL_MULTICAST", "0") == "1"
+MULTICAST_INTERFACE = os.environ.get("DL_MULTICAST_IFACE", "0.0.0.0")
+MULTICAST_POOL_SIZE = 64   # 同时收听的组播组起步数
+MAX_MULTICAST_POOL_SIZE = int(os.environ.get("DL_MAX_MULTICAST_POOL_SIZE", "512"))
+NATIVE_POOL_SIZE = 32   # 原生检测线程起步并发
+MAX_NATIVE_POOL_SIZE = int(os.environ.get("DL_MAX_NATIVE_POOL_SIZE", "256"))  # 原生检测并发上限
+# 按udpxy主机分组：每台主机先抽样HOST_SAMPLES个频道，抽样全部收不到数据的主机其余频道直接判失效；
+# udpxy默认只允许3个客户端，单主机同时检测数不超过HOST_MAX_CLIENTS
+HOST_SAMPLES = int(os.environ.get("DL_HOST_SAMPLES", "2"))
+HOST_MAX_CLIENTS = int(os.environ.get("DL_HOST_MAX_CLIENTS", "3"))
+# zubo.py扫描时记录的udpxy负载：负载轻的主机先检测，客户端数或转发带宽达到以下阈值的主机视为已满，不再拉流检测；
+# 客户端数默认与HOST_MAX_CLIENTS一致，已占满客户端名额的udpxy再连也会被拒绝
+SATURATED_CLIENTS = int(os.environ.get("DL_SATURATED_CLIENTS", str(HOST_MAX_CLIENTS)))
+SATURATED_MBPS = float(os.environ.get("DL_SATURATED_MBPS", "100"))
+# 只有SATURATED_MAX_AGE秒内的负载记录才会判为已满而跳过，更早的记录只用于排序（负载重的排后面）
+SATURATED_MAX_AGE = float(os.environ.get("DL_SATURATED_MAX_AGE", "3600"))
 # 文件编码/权限（和HB.py保持一致，兼容UTF-8/GBK）
 FILE_ENCODING = "utf-8"
 FILE_MODE = 0o644
@@ -90,7 +122,7 @@ def parse_source_file():
                     stream_url = line
                 
                 # 仅验证链接格式，不做网络预检查（保留原有逻辑）
-                if stream_url.startswith(("http://", "udp://")):
+                if stream_url.startswith(("http://", "udp://", "rtp://")):
                     data_list.append((idx, channel_name, stream_url))
                 else:
                     print(f"⚠️  第{idx}行地址格式无效，跳过：{stream_url}")
@@ -113,7 +145,7 @@ def parse_source_file():
                     else:
                         channel_name = f"频道{idx}"
                         stream_url = line
-                    if stream_url.startswith(("http://", "udp://")):
+                    if stream_url.startswith(("http://", "udp://", "rtp://")):
                         data_list.append((idx, channel_name, stream_url))
                     else:
                         print(f"⚠️  第{idx}行格式无效，跳过：{stream_url}")
@@ -131,14 +163,53 @@ def parse_source_file():
         print(f"❌ 解析HB.txt文件失败：{str(e)}")
         return []
 
-def test_single_stream(stream_url, process_ref, result_ref):
-    """单次测试流稳定性（保留原有FFmpeg核心逻辑，完善UDP超时）"""
+def load_stream_timeouts():
+    """读取网段连接耗时估计（扫描时被拒绝的连接也计入，样本远多于响应耗时）；无记录库时返回None"""
+    if not ADAPTIVE_TIMEOUT or not os.path.exists(livedb.DB_FILE):
+        return None
+    db = livedb.open_db(livedb.DB_FILE)
+    try:
+        estimates = autotune.SubnetTimeouts(livedb.load_rtt(db, "connect"))
+    finally:
+        db.close()
+    print(f"⏱️  已载入{len(estimates.known)}个网段的连接耗时，按网段设置ffprobe超时")
+    return estimates
+
+def load_server_loads():
+    """读取zubo.py记录的udpxy负载 {ip_port: {...}}；无记录库时返回空字典"""
+    if not os.path.exists(livedb.DB_FILE):
+        return {}
+    db = livedb.open_db(livedb.DB_FILE)
+    try:
+        loads = livedb.load_loads(db)
+    finally:
+        db.close()
+    if loads:
+        print(f"📊 已载入{len(loads)}台udpxy的负载记录，负载轻的先检测，近期已满的跳过")
+    return loads
+
+def is_saturated(load):
+    """负载记录足够新，且客户端数或转发带宽达到阈值"""
+    if time.time() - (load.get("updated") or 0) > SATURATED_MAX_AGE:
+        return False
+    return ((load.get("clients") or 0) >= SATURATED_CLIENTS
+            or (load.get("mbps") or 0) >= SATURATED_MBPS)
+
+def stream_timeout(estimates, stream_url):
+    """http地址按所在网段计算连接超时，udp地址和无估计的网段沿用TEST_DURATION"""
+    if estimates is None or not stream_url.startswith("http://"):
+        return TEST_DURATION
+    host = urlparse(stream_url).hostname or ""
+    return min(TEST_DURATION, max(STREAM_TIMEOUT_FLOOR, estimates.timeout(host, TEST_DURATION)))
+
+def ffprobe_command(stream_url, io_timeout=TEST_DURATION):
+    """ffprobe命令行（保留原有参数，完善UDP超时）"""
     cmd = [
         FFPROBE_PATH,
         "-v", "error",          # 只输出错误信息，减少冗余日志
         "-show_entries", "frame=pkt_pts_time",  # 检测帧时间戳（断流核心判断）
         "-of", "csv=p=0",       # 简化输出格式，方便解析
-        "-timeout", str(TEST_DURATION * 1000000),  # ffprobe内部超时（微秒）
+        "-timeout", str(int(io_timeout * 1000000)),  # ffprobe内部超时（微秒）
     ]
     # UDP专属超时配置，避免UDP链接阻塞（保留原有优化逻辑）
     if stream_url.startswith("udp://"):
@@ -147,110 +218,239 @@ def test_single_stream(stream_url, process_ref, result_ref):
         "-i", stream_url,       # 待测试流地址
         "-hide_banner"          # 隐藏banner信息，日志更整洁
     ])
-    
-    process = None
-    last_frame_time = None
-    has_disconnect = False
-    
+    return cmd
+
+async def stop_process(process):
+    """终止ffprobe进程，避免资源泄漏"""
+    if process.returncode is not None:
+        return
     try:
-        # 启动ffprobe进程（保留原有管道/缓冲配置）
-        process = subprocess.Popen(
-            cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), 0.3)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+    except ProcessLookupError:
+        pass
+
+async def test_single_stream(stream_url, duration=TEST_DURATION, io_timeout=TEST_DURATION):
+    """单次测试流稳定性：直接读取ffprobe输出的帧时间戳，有输出才处理，返回(是否稳定, 原因, 是否收到过帧)"""
+    try:
+        process = await asyncio.create_subprocess_exec(
+            *ffprobe_command(stream_url, io_timeout),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,  # 不读取的管道写满会卡住ffprobe
         )
-        process_ref[0] = process
-        
-        start_time = time.time()
-        # 循环检测指定时长，核心断流判断逻辑不变
-        while time.time() - start_time < TEST_DURATION:
-            if process.poll() is not None:  # 进程退出=流断开
-                has_disconnect = True
-                break
-            
-            # 读取帧时间戳，判断是否断流/时间戳回退
-            line = process.stdout.readline()
-            if line:
-                line = line.strip()
-                if line:
-                    try:
-                        current_frame_time = float(line)
-                        # 时间戳回退超过1秒 = 断流重连（保留原有核心判断）
-                        if last_frame_time is not None and current_frame_time < last_frame_time - 1:
-                            has_disconnect = True
-                            break
-                        last_frame_time = current_frame_time
-                    except:
-                        continue
-            
-            # 5秒无新帧 = 断流（保留原有优化逻辑）
-            if last_frame_time is not None:
-                if time.time() - start_time - last_frame_time > 5:
-                    has_disconnect = True
-                    break
-            
-            time.sleep(0.1)
-        
-        # 测试结果：无断流=True，断流/异常=False
-        result_ref[0] = not has_disconnect
+    except OSError as e:
+        return False, f"ffprobe启动失败：{str(e)[:50]}", False
     
-    except Exception as e:
-        print(f"⚠️  流测试单次异常：{str(e)[:50]}")
-        result_ref[0] = False
-    finally:
-        # 强制终止进程，避免资源泄漏（保留原有逻辑）
-        if process and process.poll() is None:
+    loop = asyncio.get_running_loop()
+    start_time = loop.time()
+    deadline = start_time + duration
+    # 首帧前还要建立连接，允许等到网络超时；之后FRAME_GAP秒无新帧即断流
+    frame_deadline = start_time + max(FRAME_GAP, io_timeout)
+    last_frame_time = None
+    try:
+        while True:
+            now = loop.time()
+            if now >= deadline:
+                # 整个测试期间一帧都没有收到，不算稳定
+                return (True, "", True) if last_frame_time is not None else (False, "没有收到帧", False)
+            if now >= frame_deadline:
+                return False, f"{FRAME_GAP}秒无新帧", last_frame_time is not None
             try:
-                process.terminate()
-                time.sleep(0.3)
-                if process.poll() is None:
-                    process.kill()
-            except Exception as e:
-                print(f"⚠️  终止ffprobe进程失败：{str(e)[:30]}")
+                line = await asyncio.wait_for(process.stdout.readline(), min(deadline, frame_deadline) - now)
+            except asyncio.TimeoutError:
+                continue
+            if not line:  # 进程退出=流断开
+                return False, "ffprobe退出（流断开）", last_frame_time is not None
+            try:
+                current_frame_time = float(line)
+            except ValueError:
+                continue
+            # 时间戳回退超过1秒 = 断流重连（保留原有核心判断）
+            if last_frame_time is not None and current_frame_time < last_frame_time - 1:
+                return False, "时间戳回退", True
+            last_frame_time = current_frame_time
+            frame_deadline = loop.time() + FRAME_GAP
+    finally:
+        await stop_process(process)
 
-def test_stream_stability(stream_url) -> bool:
-    """测试流稳定性（带重试/总超时，核心逻辑完全保留）"""
+async def test_stream_stability(stream_url, io_timeout=TEST_DURATION):
+    """测试流稳定性（带重试/总超时），返回(是否稳定, 原因, 是否收到过数据)"""
+    loop = asyncio.get_running_loop()
+    total_start = loop.time()
+    reason = ""
+    received = False
+    # 重试机制，次数由RETRY_COUNT配置；每次测试时长都不超过剩余总时间，到点即终止ffprobe
+    for retry in range(RETRY_COUNT + 1):
+        left = TOTAL_TIMEOUT - (loop.time() - total_start)
+        if left <= 0:
+            return False, f"总耗时超{TOTAL_TIMEOUT}秒", received
+        stable, reason, got_frame = await test_single_stream(stream_url, min(TEST_DURATION, left), min(io_timeout, left))
+        received = received or got_frame
+        if stable:
+            return True, reason, received
+    return False, reason, received
+
+def check_engine(stream_url):
+    """该地址使用的检测引擎：native（HTTP读TS）、multicast（组播直收）或ffprobe"""
+    if CHECK_ENGINE != "native":
+        return "ffprobe"
+    if tsprobe.parse_multicast_url(stream_url) and (MULTICAST_DIRECT or stream_url.startswith(("udp://", "rtp://"))):
+        return "multicast"
+    return "native" if stream_url.startswith("http://") else "ffprobe"
+
+def test_stream_native(stream_url, io_timeout=TEST_DURATION):
+    """原生TS分析检测流稳定性（重试/总超时与ffprobe检测一致），返回(是否稳定, 原因, 是否收到过数据)"""
     total_start = time.time()
-    
-    # 重试机制，次数由RETRY_COUNT配置
+    reason = ""
+    received = False
     for retry in range(RETRY_COUNT + 1):
-        # 总超时判断，避免无限阻塞
-        if time.time() - total_start > TOTAL_TIMEOUT:
-            print(f"⏰ 总耗时超{TOTAL_TIMEOUT}秒，强制终止", end="", flush=True)
-            return False
-        
-        if retry > 0:
-            print(f"\n🔄 第{retry}次重试...", end="", flush=True)
-        
-        process_ref = [None]
-        result_ref = [False]
-        
-        # 启动测试线程，分离主进程（保留原有线程控制逻辑）
-        test_thread = threading.Thread(
-            target=test_single_stream,
-            args=(stream_url, process_ref, result_ref)
-        )
-        test_thread.daemon = True
-        test_thread.start()
-        
-        # 线程超时控制，避免线程阻塞
-        test_thread.join(timeout=TOTAL_TIMEOUT - (time.time() - total_start))
+        left = TOTAL_TIMEOUT - (time.time() - total_start)
+        if left <= 0:
+            return False, f"总耗时超{TOTAL_TIMEOUT}秒", received
+        analyzer = tsprobe.TSAnalyzer()
+        stable, reason = tsprobe.check_http_stream(stream_url, min(TEST_DURATION, left), min(io_timeout, left),
+                                                   analyzer=analyzer)
+        received = received or analyzer.bytes > 0
+        if stable:
+            return True, reason, received
+    return False, reason, received
+
+def host_key(stream_url):
+    """http地址按 host:port 分组（同一台udpxy），udp直连组播地址不分组"""
+    if not stream_url.startswith("http://"):
+        return None
+    return urlparse(stream_url).netloc
+
+def finish_sample(host, received):
+    """记录一个抽样频道的结果：任一抽样收到数据即主机存活，全部抽样都没有数据则主机失效"""
+    host["samples_left"] -= 1
+    if not host["alive"].done() and (received or host["samples_left"] == 0):
+        host["alive"].set_result(received)
+
+async def test_stream_multicast(stream_url):
+    """组播直收检测（重试/总超时与其他引擎一致），返回(是否稳定, 原因, 是否收到过数据)"""
+    loop = asyncio.get_running_loop()
+    total_start = loop.time()
+    reason = ""
+    received = False
+    for retry in range(RETRY_COUNT + 1):
+        left = TOTAL_TIMEOUT - (loop.time() - total_start)
+        if left <= 0:
+            return False, f"总耗时超{TOTAL_TIMEOUT}秒", received
+        stable, reason, got_data = await tsprobe.check_multicast(stream_url, min(TEST_DURATION, left), MULTICAST_INTERFACE)
+        received = received or got_data
+        if stable:
+            return True, reason, received
+    return False, reason, received
+
+async def run_checks(pending, estimates, loads=None):
+    """按引擎并发检测全部地址，逐个输出结果，返回稳定的 (频道名, 地址) 列表"""
+    # 检测耗时取决于流本身（失败的流很快返回），不作为拥塞信号；并发只按系统负载增减
+    controllers = {
+        "ffprobe": autotune.AIMDController(
+            "断流检测", PROCESS_POOL_SIZE, maximum=max(PROCESS_POOL_SIZE, MAX_POOL_SIZE),
+            window=PROCESS_POOL_SIZE, pressure=autotune.load_pressure),
+        "native": autotune.AIMDController(
+            "TS分析", NATIVE_POOL_SIZE, maximum=max(NATIVE_POOL_SIZE, MAX_NATIVE_POOL_SIZE),
+            window=NATIVE_POOL_SIZE, pressure=autotune.load_pressure),
+        # 所有组播组在同一个事件循环里收包，事件循环忙不过来会表现为丢包，文件描述符和系统负载都要看
+        "multicast": autotune.AIMDController(
+            "组播接收", MULTICAST_POOL_SIZE, maximum=max(MULTICAST_POOL_SIZE, MAX_MULTICAST_POOL_SIZE),
+            window=MULTICAST_POOL_SIZE, pressure=lambda: autotune.fd_pressure() or autotune.load_pressure()),
+    }
+    loop = asyncio.get_running_loop()
+    stable_data = []
+    
+    # 按udpxy主机分组，每台主机的前HOST_SAMPLES个频道作为抽样，排在所有非抽样频道之前检测
+    # 负载已满的主机不抽样，全部频道直接判失效；其余按客户端数、带宽从轻到重排列
+    loads = loads or {}
+    hosts = {}
+    jobs = []
+    for engine, items in pending.items():
+        for item in items:
+            key = host_key(item[2]) if engine != "multicast" else None
+            host = None
+            if key is not None:
+                host = hosts.get(key)
+                if host is None:
+                    load = loads.get(key, {})
+                    # 已有客户端占用的名额要扣掉，否则超出udpxy客户端上限的检测会被拒绝而误判失效
+                    clients = max(1, HOST_MAX_CLIENTS - (load.get("clients") or 0))
+                    host = hosts[key] = {"clients": asyncio.Semaphore(clients), "samples_left": 0,
+                                         "alive": loop.create_future(), "skipped": 0, "load": load}
+                    host["saturated"] = is_saturated(host["load"])
+                    if host["saturated"]:
+                        host["alive"].set_result(False)
+                    elif HOST_SAMPLES <= 0:
+                        host["alive"].set_result(True)
+            sample = host is not None and host["samples_left"] < HOST_SAMPLES and not host["alive"].done()
+            if sample:
+                host["samples_left"] += 1
+            jobs.append((engine, item, host, sample))
+    jobs.sort(key=lambda job: (not job[3], job[2] is not None and (job[2]["load"].get("clients") or 0),
+                               job[2] is not None and (job[2]["load"].get("mbps") or 0)))
+    
+    groups = {}  # 组播组 → 收听任务，多个udpxy的同一频道共用一次结果
+    with ThreadPoolExecutor(max_workers=controllers["native"].maximum) as threads:
+        async def run(engine, stream_url):
+            io_timeout = stream_timeout(estimates, stream_url)
+            # 每种引擎的在途检测数不超过各自控制器的当前并发
+            async with controllers[engine].slot():
+                try:
+                    if engine == "native":
+                        result = await loop.run_in_executor(threads, test_stream_native, stream_url, io_timeout)
+                    elif engine == "multicast":
+                        result = await test_stream_multicast(stream_url)
+                    else:
+                        result = await test_stream_stability(stream_url, io_timeout)
+                except Exception as e:
+                    result = (False, f"检测异常：{str(e)[:50]}", False)
+            controllers[engine].record()
+            return result
         
-        # 线程超时，强制终止
-        if test_thread.is_alive():
-            print(f"⏰ 单次测试超时，强制终止", end="", flush=True)
-            if process_ref[0] and process_ref[0].poll() is None:
-                process_ref[0].terminate()
-            continue
+        async def check(engine, item, host, sample):
+            if host is not None and not sample and not await asyncio.shield(host["alive"]):
+                host["skipped"] += 1
+                if host["saturated"]:
+                    load = host["load"]
+                    return item, (False, f"udpxy负载已满（{load.get('clients') or 0}个客户端，{load.get('mbps') or 0}Mbps），跳过", False)
+                return item, (False, "同主机抽样频道都收不到数据，跳过", False)
+            if engine == "multicast":
+                address = tsprobe.parse_multicast_url(item[2])
+                if address not in groups:
+                    groups[address] = asyncio.create_task(run(engine, item[2]))
+                result = await asyncio.shield(groups[address])
+            else:
+                # 先占主机名额再占引擎并发，等待主机名额的任务不占用引擎并发
+                async with (host["clients"] if host is not None else contextlib.nullcontext()):
+                    result = await run(engine, item[2])
+            if sample:
+                finish_sample(host, result[2])
+            return item, result
         
-        # 任意一次测试成功，直接返回True
-        if result_ref[0]:
-            return True
+        tasks = [asyncio.create_task(check(*job)) for job in jobs]
+        for next_done in asyncio.as_completed(tasks):
+            (idx, channel_name, stream_url), (is_stable, reason, _) = await next_done
+            print(f"\n📌 测试第{idx}个：{channel_name[:20]}")  # 截断长频道名，日志整洁
+            print(f"🔗 地址：{stream_url[:50]}...")  # 截断长链接，日志整洁
+            print(f"⌛ 测试中（总超时{TOTAL_TIMEOUT}秒）...", end="", flush=True)
+            if is_stable:
+                print(f"✅ 稳定（无断流/超时）{('：' + reason) if reason else ''}")
+                stable_data.append((channel_name, stream_url))
+            else:
+                print(f"❌ 不稳定/超时/地址无效{('：' + reason) if reason else ''}")
     
-    # 所有重试失败，返回False
-    return False
+    dead_hosts = [host for host in hosts.values() if host["skipped"] and not host["saturated"]]
+    if dead_hosts:
+        print(f"\n⏭️  {len(dead_hosts)}台主机抽样频道都收不到数据，跳过其余{sum(host['skipped'] for host in dead_hosts)}个频道")
+    saturated_hosts = [host for host in hosts.values() if host["saturated"]]
+    if saturated_hosts:
+        print(f"⏭️  {len(saturated_hosts)}台udpxy负载已满，跳过{sum(host['skipped'] for host in saturated_hosts)}个频道")
+    return stable_data
 
 def main():
     print("🚀 组播源断流检测脚本（适配仓库根目录+FFmpeg+无预检查）")
@@ -258,7 +458,9 @@ def main():
     print(f"📥 读取文件：{SOURCE_FILE}（HB.py生成的HB.txt）")
     print(f"📤 输出文件：{OUTPUT_FILE}（稳定流地址保存为DL.txt）")
     print(f"⏱️  单次测试{TEST_DURATION}秒 | 重试{RETRY_COUNT}次 | 总超时{TOTAL_TIMEOUT}秒")
-    print(f"⚡ 进程池并发数：{PROCESS_POOL_SIZE}")
+    print(f"⚡ ffprobe并发数：{PROCESS_POOL_SIZE}起步，自动调整上限{max(PROCESS_POOL_SIZE, MAX_POOL_SIZE)}")
+    print(f"🧪 检测引擎：{CHECK_ENGINE}（原生TS分析并发{NATIVE_POOL_SIZE}起步，上限{max(NATIVE_POOL_SIZE, MAX_NATIVE_POOL_SIZE)}）")
+    print(f"📡 组播直收：{'udpxy地址也直接加入组播组' if MULTICAST_DIRECT else '仅udp/rtp地址'}，网卡{MULTICAST_INTERFACE}")
     print(f"🔧 ffprobe路径：{FFPROBE_PATH}")
     print("="*60)
     
@@ -269,45 +471,28 @@ def main():
     else:
         print("✅ 当前为root用户运行，权限充足\n")
     
-    # 第一步：检查ffprobe是否可用，不可用则直接退出
-    if not is_ffprobe_available():
-        print("❌ ffprobe不可用，脚本终止运行")
-        return
-    
-    # 第二步：解析HB.txt，获取待测试的流地址
+    # 第一步：解析HB.txt，获取待测试的流地址
     data_list = parse_source_file()
     if not data_list:
         print("❌ 未解析到有效流地址，脚本终止运行")
         return
     
-    # 第三步：进程池批量检测流稳定性（核心逻辑不变）
-    stable_data = []
+    # 第二步：需要ffprobe的地址（udp或指定ffprobe引擎）才检查ffprobe，不可用时只跳过这部分地址
+    pending = {"native": [], "multicast": [], "ffprobe": []}
+    for item in data_list:
+        pending[check_engine(item[2])].append(item)
+    if pending["ffprobe"] and not is_ffprobe_available():
+        print(f"⚠️  ffprobe不可用，跳过{len(pending['ffprobe'])}个需要ffprobe检测的地址")
+        pending["ffprobe"].clear()
+        if not pending["native"] and not pending["multicast"]:
+            print("❌ ffprobe不可用，脚本终止运行")
+            return
+    
+    # 第三步：批量检测流稳定性，ffprobe进程由事件循环直接监管，原生TS分析走线程池
     try:
-        with ProcessPoolExecutor(max_workers=PROCESS_POOL_SIZE) as executor:
-            # 提交所有测试任务，不区分链接类型，保留原有逻辑
-            future_dict = {
-                executor.submit(test_stream_stability, url): (idx, name, url)
-                for idx, name, url in data_list
-            }
-            
-            # 逐个处理测试结果，实时打印日志
-            for future in as_completed(future_dict):
-                idx, channel_name, stream_url = future_dict[future]
-                print(f"\n📌 测试第{idx}个：{channel_name[:20]}")  # 截断长频道名，日志整洁
-                print(f"🔗 地址：{stream_url[:50]}...")  # 截断长链接，日志整洁
-                print(f"⌛ 测试中（总超时{TOTAL_TIMEOUT}秒）...", end="", flush=True)
-                
-                try:
-                    is_stable = future.result()
-                    if is_stable:
-                        print("✅ 稳定（无断流/超时）")
-                        stable_data.append((channel_name, stream_url))
-                    else:
-                        print("❌ 不稳定/超时/地址无效")
-                except Exception as e:
-                    print(f"❌ 检测异常：{str(e)[:50]}")
+        stable_data = asyncio.run(run_checks(pending, load_stream_timeouts(), load_server_loads()))
     except Exception as e:
-        print(f"\n❌ 进程池运行异常：{str(e)}")
+        print(f"\n❌ 检测运行异常：{str(e)}")
         return
 
     # 第四步：保存稳定流地址到DL.txt（仓库根目录）
@@ -0,0 +1,240 @@
+import os
+import time
+import errno
+import asyncio
+import threading
+import contextlib
+import collections
+
+# ==================== AIMD并发自适应（zubo.py / iptv.py / DL.py共用） ====================
+# 每积累一个窗口的样本做一次判断：超时/重置比例和延迟都与最近几个窗口的中位数持平时并发+step（加性增），
+# 连续CONGESTED_WINDOWS个窗口超时/重置比例明显升高或延迟翻倍时并发×DECREASE（乘性减），
+# 出现文件描述符/系统负载压力时立即乘性减
+# 扫描空地址时连接超时是常态，不同网段被拒绝（RST）的往返时间也各不相同，两者都不作为拥塞信号
+ERROR_MARGIN = 0.1        # 超时+重置比例超过基线多少算拥塞
+LATENCY_FACTOR = 2.0      # 延迟中位数超过基线多少倍算拥塞
+LATENCY_FLOOR = 0.05      # 延迟至少比基线多出该值（秒）才算拥塞，过滤本机/局域网的计时抖动
+HISTORY_WINDOWS = 8       # 基线取最近多少个窗口的中位数
+CONGESTED_WINDOWS = 3     # 连续多少个窗口拥塞才降并发
+LOG_INTERVAL = 10         # 并发调整日志的最小间隔（秒）
+DECREASE = 0.7            # 乘性减系数
+
+FD_ERRNOS = {errno.EMFILE, errno.ENFILE, errno.ENOBUFS, errno.EADDRNOTAVAIL}
+RESET_ERRNOS = {errno.ECONNRESET, errno.ECONNABORTED, errno.EPIPE}
+
+def classify_error(exc, connected=None):
+    """把探测异常归类：'fd' 本机资源不足，'timeout' 已知开放的主机超时，'reset' 连接被重置，
+    'dark' 连接阶段超时（扫描空地址的常态），'refused' 连接被拒绝，None 为其他不可达
+    connected：True 主机已知开放（连接已建立或已通过预筛），所有超时都算'timeout'；
+    False 异常发生在建立连接阶段，超时算'dark'；None 按异常类型判断（requests/urllib3的ConnectTimeout算'dark'）"""
+    seen = set()
+    stack = [exc]
+    kind = None
+    # requests/urllib3会把底层OSError层层包装，逐层展开查找
+    while stack:
+        current = stack.pop()
+        if not isinstance(current, BaseException) or id(current) in seen:
+            continue
+        seen.add(id(current))
+        if getattr(current, "errno", None) in FD_ERRNOS:
+            return "fd"
+        if getattr(current, "errno", None) in RESET_ERRNOS or isinstance(current, ConnectionResetError):
+            kind = kind or "reset"
+        elif getattr(current, "errno", None) == errno.ECONNREFUSED or isinstance(current, ConnectionRefusedError):
+            kind = kind or "refused"
+        elif "ConnectTimeout" in type(current).__name__:
+            kind = kind or ("timeout" if connected else "dark")
+        elif isinstance(current, TimeoutError) or "Timeout" in type(current).__name__:
+            kind = kind or ("dark" if connected is False else "timeout")
+        stack.extend([current.__cause__, current.__context__, getattr(current, "reason", None), *current.args])
+    return kind
+
+def fd_pressure():
+    """已打开文件描述符超过软上限90%时返回True（仅Linux可用，其他系统返回False）"""
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        return soft != resource.RLIM_INFINITY and len(os.listdir('/proc/self/fd')) > soft * 0.9
+    except (ImportError, OSError, ValueError):
+        return False
+
+def load_pressure():
+    """1分钟平均负载超过CPU核数1.5倍时返回True，供DL.py这类CPU密集的阶段使用"""
+    try:
+        return os.getloadavg()[0] > (os.cpu_count() or 1) * 1.5
+    except (AttributeError, OSError):
+        return False
+
+def median(values):
+    """中位数，空序列返回None"""
+    values = sorted(values)
+    return values[len(values) // 2] if values else None
+
+class AIMDController:
+    """并发上限控制器：线程池用 acquire/release 或 run，协程用 async with slot()"""
+
+    def __init__(self, name, initial, minimum=1, maximum=None, step=None, window=None, pressure=fd_pressure):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum or initial * 10
+        self.limit = max(minimum, min(initial, self.maximum))
+        self.step = step or max(1, initial // 10)
+        self.window = window or max(20, initial)
+        self.pressure = pressure
+        self.inflight = 0
+        self._samples = []
+        self._error_history = collections.deque(maxlen=HISTORY_WINDOWS)
+        self._latency_history = collections.deque(maxlen=HISTORY_WINDOWS)
+        self._congested = 0
+        self._cond = threading.Condition()
+        self._waiters = collections.deque()
+        self._logged = 0.0
+
+    def record(self, latency=None, error=None):
+        """记录一次探测结果：latency为耗时（秒），error为classify_error的返回值"""
+        with self._cond:
+            self._samples.append((latency, error))
+            if len(self._samples) >= self.window:
+                self._adjust()
+
+    def _adjust(self):
+        samples, self._samples = self._samples, []
+        errors = sum(1 for _, error in samples if error in ("timeout", "reset"))
+        error_rate = errors / len(samples)
+        # 延迟只看成功的探测：被拒绝（RST）的往返时间取决于正在扫描哪个网段
+        latency = median([latency for latency, error in samples if latency is not None and error is None])
+        # 基线取最近几个窗口的中位数（不含本窗口），持续的变化几个窗口后就成为新基线
+        base_error = median(self._error_history)
+        base_latency = median(self._latency_history)
+        self._error_history.append(error_rate)
+        if latency is not None:
+            self._latency_history.append(latency)
+        reason = None
+        if any(error == "fd" for _, error in samples) or (self.pressure and self.pressure()):
+            reason = "系统资源不足"
+            self._congested = CONGESTED_WINDOWS
+        elif base_error is not None and error_rate > base_error + ERROR_MARGIN:
+            reason = f"超时/重置比例{error_rate:.0%}"
+            self._congested += 1
+        elif latency is not None and base_latency is not None and latency > max(
+                base_latency * LATENCY_FACTOR, base_latency + LATENCY_FLOOR):
+            reason = f"延迟升至{latency:.2f}秒"
+            self._congested += 1
+        else:
+            self._congested = 0
+        old = self.limit
+        if reason:
+            # 偶发的一个拥塞窗口只保持并发不变，连续拥塞才降
+            if self._congested < CONGESTED_WINDOWS:
+                return
+            self._congested = 0
+            self.limit = max(self.minimum, int(self.limit * DECREASE))
+            if self.limit != old and time.monotonic() - self._logged > LOG_INTERVAL:
+                self._logged = time.monotonic()
+                print(f"⚙️  {self.name}并发 {old} → {self.limit}（{reason}）")
+        else:
+            self.limit = min(self.maximum, self.limit + self.step)
+            self._cond.notify_all()
+            self._wake_async()
+
+    def acquire(self):
+        with self._cond:
+            while self.inflight >= self.limit:
+                self._cond.wait()
+            self.inflight += 1
+
+    def release(self):
+        with self._cond:
+            self.inflight -= 1
+            self._cond.notify()
+
+    def run(self, fn, *args):
+        """在并发上限内执行fn，供ThreadPoolExecutor提交使用"""
+        self.acquire()
+        try:
+            return fn(*args)
+        finally:
+            self.release()
+
+    def _wake_async(self):
+        while self._waiters and self.inflight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                self.inflight += 1
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        """协程版本：在同一个事件循环内使用，等待期间不占用线程"""
+        if self.inflight < self.limit and not self._waiters:
+            self.inflight += 1
+        else:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif waiter.done() and not waiter.cancelled():
+                    self.inflight -= 1
+                    self._wake_async()
+                raise
+        try:
+            yield
+        finally:
+            self.inflight -= 1
+            self._wake_async()
+
+# ==================== 按/24网段学习的自适应超时 ====================
+# 连接成功或被拒绝（RST）的耗时都是一次往返的真实样本，超时只说明“比超时长”，不计入样本
+# 超时取网段p95的RTT_MULTIPLIER倍，并夹在[RTT_FLOOR, 默认超时×RTT_CEILING]之间：
+# 快网段的死主机不再白等满默认超时，慢的海外线路也不会因默认超时过短而漏判
+RTT_MULTIPLIER = 4        # 超时取p95的倍数
+RTT_MIN_SAMPLES = 8       # 网段样本数达到该值才使用学习到的超时
+RTT_KEEP = 64             # 每个网段保留的最近样本数
+RTT_FLOOR = 0.3           # 学习到的超时下限（秒）
+RTT_CEILING = 2.0         # 学习到的超时上限为默认超时的倍数
+
+def subnet_of(host):
+    """a.b.c.d → a.b.c，非IPv4地址（域名）按整个主机名归组"""
+    parts = host.split('.')
+    if len(parts) == 4 and all(part.isdigit() for part in parts):
+        return '.'.join(parts[:3])
+    return host
+
+class SubnetTimeouts:
+    """按/24网段记录RTT样本并给出超时；known为持久化的 {网段: p95}，本次运行样本不足时使用"""
+
+    def __init__(self, known=None):
+        self.known = dict(known or {})
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, host, rtt):
+        with self._lock:
+            samples = self._samples.get(subnet_of(host))
+            if samples is None:
+                samples = self._samples[subnet_of(host)] = collections.deque(maxlen=RTT_KEEP)
+            samples.append(rtt)
+
+    def p95(self, subnet):
+        with self._lock:
+            samples = sorted(self._samples.get(subnet, ()))
+        if len(samples) >= RTT_MIN_SAMPLES:
+            return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+        return self.known.get(subnet)
+
+    def timeout(self, host, default):
+        """host所在网段的超时；网段还没有足够样本时返回default"""
+        p95 = self.p95(subnet_of(host))
+        if p95 is None:
+            return default
+        return min(default * RTT_CEILING, max(min(RTT_FLOOR, default), p95 * RTT_MULTIPLIER))
+
+    def estimates(self):
+        """本次运行样本充足的网段：{网段: (p95, 样本数)}，供持久化"""
+        with self._lock:
+            subnets = {subnet: len(samples) for subnet, samples in self._samples.items()
+                       if len(samples) >= RTT_MIN_SAMPLES}
+        return {subnet: (self.p95(subnet), count) for subnet, count in subnets.items()}
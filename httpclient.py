@@ -0,0 +1,86 @@
+import os
+import time
+import threading
+import contextlib
+import requests
+from requests.adapters import HTTPAdapter
+
+# ==================== 共用HTTP客户端（zubo.py / iptv.py / tsprobe.py共用） ====================
+# 所有请求走同一个requests会话：按主机复用keep-alive连接，限制全局和单主机同时占用的连接数，
+# 并支持整体截止时间（deadline），连接/读取超时都不会超过剩余时间
+MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", "1000"))  # 全局同时在用的连接数
+MAX_PER_HOST = int(os.environ.get("HTTP_MAX_PER_HOST", "8"))           # 单个主机同时在用的连接数
+MAX_HOST_POOLS = 1000     # 保留连接池的主机数，超出后最久未用的主机连接被关闭
+
+class DeadlineExceeded(requests.Timeout):
+    """请求在截止时间前没有完成"""
+
+_session = None
+_session_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(MAX_CONNECTIONS)
+
+def session():
+    """返回共用会话（首次调用时创建）"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            # pool_block=True：单主机连接数达到上限时排队等待，而不是临时新建连接
+            adapter = HTTPAdapter(pool_connections=MAX_HOST_POOLS, pool_maxsize=MAX_PER_HOST, pool_block=True)
+            _session.mount("http://", adapter)
+            _session.mount("https://", adapter)
+        return _session
+
+def remaining(deadline):
+    """距截止时间的剩余秒数，已超时则抛出DeadlineExceeded"""
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("请求超过截止时间")
+    return left
+
+def past_deadline(deadline):
+    """超时发生在截止时间附近时视为截止（超时本来就被限制在剩余时间内，留一点计时误差）"""
+    return deadline is not None and deadline - time.monotonic() <= 0.05
+
+def cap_timeout(timeout, left):
+    """把requests的timeout（秒数或(连接, 读取)元组）限制在剩余时间内"""
+    if timeout is None:
+        return left
+    if isinstance(timeout, tuple):
+        return tuple(left if value is None else min(value, left) for value in timeout)
+    return min(timeout, left)
+
+@contextlib.contextmanager
+def get(url, timeout=None, deadline=None, **kwargs):
+    """GET请求的上下文管理器：with get(url) as resp，退出时关闭响应、归还连接和全局名额
+    deadline为time.monotonic()下的截止时刻，请求发出前和读取响应体时（iter_content）都会检查"""
+    if deadline is not None:
+        timeout = cap_timeout(timeout, remaining(deadline))
+    with _slots:
+        try:
+            resp = session().get(url, timeout=timeout, **kwargs)
+        except requests.Timeout as e:
+            if past_deadline(deadline):
+                raise DeadlineExceeded("请求超过截止时间") from e
+            raise
+        try:
+            yield resp
+        finally:
+            resp.close()
+
+def iter_content(resp, deadline=None, chunk_size=16384):
+    """按块读取响应体，超过截止时间时抛出DeadlineExceeded"""
+    chunks = resp.iter_content(chunk_size)
+    while True:
+        try:
+            chunk = next(chunks, None)
+        except (requests.Timeout, requests.ConnectionError) as e:
+            # requests在读取响应体时把读超时包装成ConnectionError
+            if past_deadline(deadline):
+                raise DeadlineExceeded("读取响应超过截止时间") from e
+            raise
+        if chunk is None:
+            return
+        yield chunk
+        if deadline is not None:
+            remaining(deadline)
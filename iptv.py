@@ -1,13 +1,29 @@
-import eventlet
-eventlet.monkey_patch()
 import time
 import datetime
-from threading import Thread
+from threading import Thread, Event, Lock, BoundedSemaphore
 import os
 import re
+import json
+import codecs
+import contextlib
+import socket
 from queue import Queue
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import livedb
+import httpclient
+import autotune
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+# 自适应超时：按/24网段学习连接/响应耗时的p95，代码中的固定超时只作为样本不足时的默认值（IPTV_ADAPTIVE_TIMEOUT=0关闭）
+ADAPTIVE_TIMEOUT = os.environ.get("IPTV_ADAPTIVE_TIMEOUT", "1") == "1"
+rtt_connect = autotune.SubnetTimeouts()
+rtt_read = autotune.SubnetTimeouts()
+def split_host(url):
+    return url.split('/')[2].rsplit(':', 1)[0]
+# 返回HTTP请求使用的(连接超时, 读取超时)
+def adaptive_timeout(url, default):
+    if not ADAPTIVE_TIMEOUT:
+        return default
+    host = split_host(url)
+    return rtt_connect.timeout(host, default), rtt_read.timeout(host, default)
 # 读取文件并设置参数
 def read_config(config_file):
     ip_configs = []
@@ -22,101 +38,441 @@ def read_config(config_file):
         return ip_configs
     except Exception as e:
         print(f"读取文件错误: {e}")
+# 探测只读取响应开头：看到标记即停止，最多读PROBE_MAX_BYTES字节、PROBE_MAX_TIME秒，不下载整个频道列表
+PROBE_MAX_BYTES = 8 * 1024
+PROBE_MAX_TIME = 4
+def body_has_marker(resp, markers, deadline):
+    data = b""
+    for chunk in httpclient.iter_content(resp, deadline, 1024):
+        data += chunk
+        if any(marker in data for marker in markers):
+            return True
+        if len(data) >= PROBE_MAX_BYTES:
+            break
+    return False
 # 发送get请求检测url是否可访问
-def check_ip_port(ip_port, url_end):
+# connected=True：主机已通过TCP预筛，连接超时也算拥塞信号（见autotune.classify_error）
+def check_ip_port(ip_port, url_end, controller=None, connected=None):
+    start, error = time.monotonic(), None
     try:
         url = f"http://{ip_port}{url_end}"
-        resp = requests.get(url, timeout=2)
-        resp.raise_for_status()
-        if "tsfile" in resp.text or "hls" in resp.text:
+        with httpclient.get(url, timeout=adaptive_timeout(url, 2), deadline=start + PROBE_MAX_TIME, stream=True) as resp:
+            rtt_read.record(split_host(url), resp.elapsed.total_seconds())
+            resp.raise_for_status()
+            found = body_has_marker(resp, (b"tsfile", b"hls"), start + PROBE_MAX_TIME)
+        if found:
             print(f"{url} 访问成功")
             return url
-    except:
+    except Exception as e:
+        error = autotune.classify_error(e, connected)
         return None
-# 多线程检测url，获取有效ip_port
-def scan_ip_port(ip, port, url_end):
-    valid_urls = []
-    a, b, c, d = map(int, ip.split('.'))
-    ip_ports = [f"{a}.{b}.{c}.{x}:{port}" for x in range(1, 256)]
-    with ThreadPoolExecutor(max_workers=100) as executor:
-        futures = {executor.submit(check_ip_port, ip_port, url_end): ip_port for ip_port in ip_ports}
-        for future in as_completed(futures):
-            result = future.result()
-            if result:
-                valid_urls.append(result)
-    return valid_urls    
-# 发送GET请求获取JSON文件, 解析JSON文件, 获取频道信息
-def extract_channels(url):
-    hotel_channels = []
+    finally:
+        # 把耗时和错误类型反馈给并发控制器
+        if controller is not None:
+            controller.record(time.monotonic() - start, error)
+# TCP连接预筛：只建立连接不发请求，短超时快速排除无服务的地址
+CONNECT_TIMEOUT = 1
+def check_tcp_connect(ip_port, controller=None):
+    host, port = ip_port.rsplit(':', 1)
+    timeout = rtt_connect.timeout(host, CONNECT_TIMEOUT) if ADAPTIVE_TIMEOUT else CONNECT_TIMEOUT
+    start, error = time.monotonic(), None
     try:
-        json_url = f"{url}"
-        urls = url.split('/', 3)
-        url_x = f"{urls[0]}//{urls[2]}"
-        if "iptv" in json_url:
-            response = requests.get(json_url, timeout=2)
-            json_data = response.json()
-            for item in json_data['data']:
+        with socket.create_connection((host, int(port)), timeout=timeout):
+            rtt_connect.record(host, time.monotonic() - start)
+            return ip_port
+    except ConnectionRefusedError as e:
+        # 被拒绝（RST）的耗时同样是一次完整往返
+        rtt_connect.record(host, time.monotonic() - start)
+        error = autotune.classify_error(e, connected=False)
+        return None
+    except OSError as e:
+        error = autotune.classify_error(e, connected=False)
+        return None
+    finally:
+        if controller is not None:
+            controller.record(time.monotonic() - start, error)
+# 并发由AIMD控制器按超时/重置/延迟自动调整：起步沿用原来的线程数，上限可用环境变量放宽
+SCAN_MAX_WORKERS = int(os.environ.get("IPTV_SCAN_MAX_WORKERS", "500"))
+SPEED_MAX_WORKERS = int(os.environ.get("IPTV_SPEED_MAX_WORKERS", "100"))
+FOUND_QUEUE_SIZE = 100
+# 多线程检测url，获取有效ip_port
+# 所有配置的C段合并成一次扫描，每个主机只做一次存活判断，再依次尝试各个接口路径
+# 生成器：某个主机连接成功就立即检测接口，可访问的url马上产出给下一阶段，不等整轮扫描结束
+def scan_ip_port(ip_configs, url_ends):
+    ip_ports = []
+    for ip, port in ip_configs:
+        a, b, c, d = map(int, ip.split('.'))
+        ip_ports.extend(f"{a}.{b}.{c}.{x}:{port}" for x in range(1, 256))
+    connect_controller = autotune.AIMDController("TCP预筛", 255, maximum=max(255, SCAN_MAX_WORKERS))
+    check_controller = autotune.AIMDController("酒店源扫描", 100, maximum=SCAN_MAX_WORKERS)
+    found = Queue(maxsize=FOUND_QUEUE_SIZE)
+    opened = [0]
+    def connect_then_check(ip_port):
+        # 先TCP连接预筛，端口开放的地址才进入HTTP验证
+        if connect_controller.run(check_tcp_connect, ip_port, connect_controller):
+            opened[0] += 1
+            for url in check_controller.run(check_url_ends, ip_port, url_ends, check_controller):
+                found.put(url)
+    def feed():
+        # 在途任务窗口等于两个阶段控制器的当前并发之和，完成一个补一个，下游测速跟不上时found满了自动等待
+        targets = iter(ip_ports)
+        futures = set()
+        def submit_next():
+            while len(futures) < connect_controller.limit + check_controller.limit:
+                ip_port = next(targets, None)
+                if ip_port is None:
+                    return
+                futures.add(executor.submit(connect_then_check, ip_port))
+        try:
+            with ThreadPoolExecutor(max_workers=connect_controller.maximum) as executor:
+                submit_next()
+                while futures:
+                    done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                    futures.difference_update(done)
+                    submit_next()
+        finally:
+            found.put(None)  # 所有地址都检测完毕
+    Thread(target=feed, daemon=True).start()
+    while True:
+        url = found.get()
+        if url is None:
+            break
+        yield url
+    print(f"TCP预筛完成：{opened[0]}/{len(ip_ports)}个地址端口开放")
+# 对一个开放端口的主机依次尝试各接口路径，返回可访问的url列表
+def check_url_ends(ip_port, url_ends, controller=None):
+    return [url for url in (check_ip_port(ip_port, url_end, controller, True) for url_end in url_ends) if url]
+# 增量解析JSON对象中的某个数组字段：边下载边逐个产出数组元素，大文档不必等全部下载完再解析
+def iter_json_array(chunks, key):
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder('utf-8-sig')(errors='ignore')
+    chunks = iter(chunks)
+    state = {"buffer": "", "pos": 0, "eof": False}
+    def more():
+        chunk = next(chunks, None)
+        if chunk is None:
+            state["eof"] = True
+            state["buffer"] += text_decoder.decode(b"", final=True)
+            return False
+        state["buffer"] = state["buffer"][state["pos"]:] + text_decoder.decode(chunk)
+        state["pos"] = 0
+        return True
+    def peek():
+        while True:
+            buffer, pos = state["buffer"], state["pos"]
+            while pos < len(buffer) and buffer[pos] in " \t\r\n":
+                pos += 1
+            state["pos"] = pos
+            if pos < len(buffer):
+                return buffer[pos]
+            if state["eof"] or not more():
+                raise ValueError("JSON不完整")
+    def expect(char):
+        if peek() != char:
+            raise ValueError(f"JSON格式错误：缺少{char}")
+        state["pos"] += 1
+    def value():
+        peek()
+        while True:
+            try:
+                result, end = decoder.raw_decode(state["buffer"], state["pos"])
+                # 值结束在缓冲区最后几个字符内时可能被截断（如数字停在“45.”“1e”处），还有数据就再读一块重新解析
+                if end < len(state["buffer"]) - 8 or state["eof"] or not more():
+                    state["pos"] = end
+                    return result
+            except json.JSONDecodeError:
+                if state["eof"] or not more():
+                    raise
+    expect('{')
+    while peek() != '}':
+        if peek() == ',':
+            state["pos"] += 1
+        name = value()
+        expect(':')
+        if name == key and peek() == '[':
+            state["pos"] += 1
+            while peek() != ']':
+                if peek() == ',':
+                    state["pos"] += 1
+                yield value()
+            return
+        value()
+# 发送GET请求获取JSON文件, 解析JSON文件, 获取频道信息；边下载边产出频道
+def iter_channels(url):
+    json_url = f"{url}"
+    urls = url.split('/', 3)
+    url_x = f"{urls[0]}//{urls[2]}"
+    if "iptv" in json_url:
+        with httpclient.get(json_url, timeout=adaptive_timeout(json_url, 2), stream=True) as response:
+            for item in iter_json_array(response.iter_content(8192), 'data'):
                 if isinstance(item, dict):
                     name = item.get('name')
                     urlx = item.get('url')
-                    if "tsfile" in urlx:
+                    if urlx and "tsfile" in urlx:
                         urld = f"{url_x}{urlx}"
-                        hotel_channels.append((name, urld))
-        elif "ZHGXTV" in json_url:
-            response = requests.get(json_url, timeout=2)
-            json_data = response.content.decode('utf-8')
-            data_lines = json_data.split('\n')
-            for line in data_lines:
+                        yield name, urld
+    elif "ZHGXTV" in json_url:
+        with httpclient.get(json_url, timeout=adaptive_timeout(json_url, 2), stream=True) as response:
+            for line in response.iter_lines():
+                line = line.decode('utf-8', errors='ignore')
                 if "," in line and "hls" in line:
                     name, channel_url = line.strip().split(',')
                     parts = channel_url.split('/', 3)
                     if len(parts) >= 4:
                         urld = f"{url_x}/{parts[3]}"
-                        hotel_channels.append((name, urld))
-        return hotel_channels
+                        yield name, urld
+# 并发提取频道列表：url一到就提交提取，频道解析出来就交给测速；同一主机的请求由共用HTTP客户端复用连接
+# 各阶段之间都是有界队列，下游处理不过来时上游自动等待
+EXTRACT_MAX_WORKERS = 32
+CHANNEL_QUEUE_SIZE = 1000
+def extract_url_channels(url, channel_queue):
+    try:
+        for channel in iter_channels(url):
+            channel_queue.put(channel)
     except Exception:
-        return []
-# 测速
+        pass
+def iter_extracted_channels(valid_urls):
+    channel_queue = Queue(maxsize=CHANNEL_QUEUE_SIZE)
+    slots = BoundedSemaphore(EXTRACT_MAX_WORKERS * 2)
+    def feed():
+        try:
+            with ThreadPoolExecutor(max_workers=EXTRACT_MAX_WORKERS) as executor:
+                for url in valid_urls:
+                    slots.acquire()
+                    future = executor.submit(extract_url_channels, url, channel_queue)
+                    future.add_done_callback(lambda _: slots.release())
+        except Exception as e:
+            print(f"提取频道出错：{e}")
+        finally:
+            channel_queue.put(None)  # 所有url都提取完毕
+    Thread(target=feed, daemon=True).start()
+    count = 0
+    while True:
+        channel = channel_queue.get()
+        if channel is None:
+            break
+        count += 1
+        yield channel
+    print(f"共获取频道：{count}个")
+# 流式下载TS片段并在内存中计数测速，不写磁盘；读满SPEED_SAMPLE_BYTES或超过SPEED_SAMPLE_TIME秒即停止采样
+SPEED_SAMPLE_BYTES = 2 * 1024 * 1024
+SPEED_SAMPLE_TIME = 5
+# 返回(首字节耗时秒, 持续吞吐MB/s, 采样字节数)；持续吞吐不含首字节等待
+def measure_segment(ts_url, max_bytes=SPEED_SAMPLE_BYTES):
+    start = time.monotonic()
+    first = last = None
+    size = first_size = 0
+    with httpclient.get(ts_url, timeout=adaptive_timeout(ts_url, 2), deadline=start + SPEED_SAMPLE_TIME, stream=True) as resp:
+        resp.raise_for_status()
+        for chunk in resp.iter_content(16384):
+            last = time.monotonic()
+            if first is None:
+                first, first_size = last, len(chunk)
+            size += len(chunk)
+            if size >= max_bytes or last - start > SPEED_SAMPLE_TIME:
+                break
+    if not size:
+        return None, 0.0, 0
+    # 只收到一块数据时无法区分首字节和后续传输，退化为总字节/总耗时
+    if size > first_size and last > first:
+        throughput = (size - first_size) / (last - first)
+    else:
+        throughput = size / max(last - start, 1e-6)
+    return first - start, throughput / 1024 / 1024, size
+# HLS持续探测模式（IPTV_SPEED_MODE=hls）：在短时间窗口内反复刷新播放列表并连续下载几个片段，
+# 用“片段时长/下载耗时”判断能否跟上实时播放，同时统计播放列表刷新延迟；实时倍率低于HLS_MIN_RATIO的源被剔除
+SPEED_MODE = os.environ.get("IPTV_SPEED_MODE", "segment")
+HLS_PROBE_SEGMENTS = 3
+HLS_PROBE_WINDOW = 12
+HLS_MIN_RATIO = 1.0
+# 解析m3u8：返回(首个片段序号, 目标时长, [(片段时长, 片段文件名), ...])
+def parse_playlist(text):
+    sequence, target, duration, segments = 0, None, None, []
+    for line in text.splitlines():
+        line = line.strip()
+        try:
+            if line.startswith('#EXT-X-MEDIA-SEQUENCE:'):
+                sequence = int(line.split(':', 1)[1])
+            elif line.startswith('#EXT-X-TARGETDURATION:'):
+                target = float(line.split(':', 1)[1])
+            elif line.startswith('#EXTINF:'):
+                duration = float(line.split(':', 1)[1].split(',')[0])
+        except ValueError:
+            pass
+        if line and not line.startswith('#'):
+            segments.append((duration or 0.0, line.split('/')[-1]))  # 与单片段测速一致，片段按m3u8所在目录拼接
+            duration = None
+    return sequence, target, segments
+# 返回(首字节耗时秒, 吞吐MB/s, 下载字节数, 实时倍率, 播放列表刷新延迟中位数)；片段时长缺失时实时倍率为None
+def probe_hls(channel_url):
+    channel_url_t = channel_url.rstrip(channel_url.split('/')[-1])
+    start = time.monotonic()
+    deadline = start + HLS_PROBE_WINDOW
+    ttfb, size, media, busy, downloaded = None, 0, 0.0, 0.0, 0
+    refreshes = []
+    next_sequence = None
+    try:
+        while downloaded < HLS_PROBE_SEGMENTS:
+            fetched = time.monotonic()
+            with httpclient.get(channel_url, timeout=adaptive_timeout(channel_url, 2), deadline=deadline) as resp:
+                text = resp.text
+            refreshes.append(time.monotonic() - fetched)
+            sequence, target, segments = parse_playlist(text)
+            if not segments:
+                break
+            if next_sequence is None:
+                next_sequence = sequence + max(0, len(segments) - HLS_PROBE_SEGMENTS)  # 首次从靠近直播边缘的片段开始
+            elif next_sequence < sequence:
+                next_sequence = sequence  # 落后太多时从列表头继续
+            pending = segments[next_sequence - sequence:]
+            if not pending:
+                # 已到直播边缘：等半个目标时长再刷新
+                time.sleep(max(0.2, min((target or 2) / 2, httpclient.remaining(deadline))))
+                continue
+            # 每下载一个片段重新刷新一次播放列表，刷新延迟取多次请求的中位数
+            for duration, name in pending[:1]:
+                segment_start = time.monotonic()
+                try:
+                    with httpclient.get(channel_url_t + name, timeout=adaptive_timeout(channel_url, 2),
+                                        deadline=deadline, stream=True) as resp:
+                        resp.raise_for_status()
+                        for chunk in httpclient.iter_content(resp, deadline):
+                            if ttfb is None:
+                                ttfb = time.monotonic() - start
+                            size += len(chunk)
+                finally:
+                    busy += time.monotonic() - segment_start
+                media += duration
+                downloaded += 1
+                next_sequence += 1
+    except httpclient.DeadlineExceeded:
+        pass  # 窗口结束时没下载完的片段只计耗时不计时长，跟不上实时的源倍率自然偏低
+    if not size:
+        return None, 0.0, 0, None, None
+    # 一个片段都没下完说明跟不上实时；片段都下完但m3u8没写时长时无法判断
+    ratio = media / busy if media else (0.0 if downloaded == 0 else None)
+    refresh = sorted(refreshes)[len(refreshes) // 2]
+    return ttfb, size / max(busy, 1e-6) / 1024 / 1024, size, ratio, refresh
+# 按源主机分组测速：同一主机的频道共用上行带宽，每个主机只完整测速HOST_SAMPLE_CHANNELS个代表频道（依次进行，互不抢带宽），
+# 其余频道只读取SPOT_CHECK_BYTES确认存活，速度取所在主机代表频道的中位数（IPTV_HOST_SAMPLES=0时逐个完整测速）
+HOST_SAMPLE_CHANNELS = int(os.environ.get("IPTV_HOST_SAMPLES", "2"))
+SPOT_CHECK_BYTES = 16 * 1024
+# 测速：channels可以是列表，也可以是边提取边产出的生成器
 def speed_test(channels):
     def show_progress():
-        while checked[0] < len(channels):
-            numberx = checked[0] / len(channels) * 100
-            print(f"已测试{checked[0]}/{len(channels)}，可用频道:{len(results)}个，进度:{numberx:.2f}%")
-            time.sleep(5)
+        while not finished.is_set():
+            numberx = checked[0] / queued[0] * 100 if queued[0] else 0
+            print(f"已测试{checked[0]}/{queued[0]}，可用频道:{len(alive)}个，进度:{numberx:.2f}%")
+            finished.wait(5)
+    # 领取测速方式：主机的代表频道名额未满（含正在测的）时完整测速
+    def take_sample_slot(host):
+        with host_lock:
+            if HOST_SAMPLE_CHANNELS <= 0:
+                return True
+            if host_sampling.get(host, 0) >= HOST_SAMPLE_CHANNELS:
+                return False
+            host_sampling[host] = host_sampling.get(host, 0) + 1
+            host_locks.setdefault(host, Lock())
+            return True
     # 定义工作线程函数
     def worker():
         while True:
             channel_name, channel_url = task_queue.get()  # 从队列中获取一个任务
+            host = channel_url.split('/')[2]
+            full = take_sample_slot(host)
+            measured = False
+            controller.acquire()  # 在控制器允许的并发内测速
+            start, error = time.monotonic(), None
             try:
-                channel_url_t = channel_url.rstrip(channel_url.split('/')[-1])  # m3u8链接前缀
-                lines = requests.get(channel_url,timeout=2).text.strip().split('\n')  # 获取m3u8文件内容
-                ts_lists = [line.split('/')[-1] for line in lines if line.startswith('#') == False]  # 获取m3u8文件下视频流后缀
-                ts_url = channel_url_t + ts_lists[0]  # 拼接单个视频片段下载链接
-                ts_lists_0 = ts_lists[0].rstrip(ts_lists[0].split('.ts')[-1])  # m3u8链接前缀
-                with eventlet.Timeout(5, False):    # 获取视频数据进行5秒钟限制
-                    start_time = time.time()
-                    cont = requests.get(ts_url, timeout=2).content
-                    resp_time = (time.time() - start_time) * 1                    
-                if cont:
-                    checked[0] += 1
-                    with open(ts_lists_0, 'ab') as f:
-                        f.write(cont)  # 写入文件
-                    normalized_speed = max(len(cont) / resp_time / 1024 / 1024, 0.001)
-                    os.remove(ts_lists_0)
-                    result = channel_name, channel_url, f"{normalized_speed:.3f}"
-                    results.append(result)
-            except:
+                ratio = None
+                if full and SPEED_MODE == "hls":
+                    with host_locks.get(host) or contextlib.nullcontext():
+                        ttfb, speed, size, ratio, refresh = probe_hls(channel_url)
+                    if size:
+                        refreshes.append(refresh)
+                else:
+                    channel_url_t = channel_url.rstrip(channel_url.split('/')[-1])  # m3u8链接前缀
+                    with httpclient.get(channel_url, timeout=adaptive_timeout(channel_url, 2)) as resp:
+                        lines = resp.text.strip().split('\n')  # 获取m3u8文件内容
+                    ts_lists = [line.split('/')[-1] for line in lines if line.startswith('#') == False]  # 获取m3u8文件下视频流后缀
+                    ts_url = channel_url_t + ts_lists[0]  # 拼接单个视频片段下载链接
+                    # 抽查同样占用主机锁，不与代表频道同时下载、争抢该主机的上行带宽和连接池
+                    with host_locks.get(host) or contextlib.nullcontext():
+                        ttfb, speed, size = measure_segment(ts_url, max_bytes=SPEED_SAMPLE_BYTES if full else SPOT_CHECK_BYTES)
+                if size:
+                    if full:
+                        measured = True
+                        samples.append((ttfb, speed, size))
+                        host_speeds.setdefault(host, []).append(speed)
+                        if ratio is not None:
+                            host_ratios.setdefault(host, []).append(ratio)
+                    if ratio is None or ratio >= HLS_MIN_RATIO:
+                        alive.append((channel_name, channel_url, host, speed))
+            except Exception as e:
+                error = autotune.classify_error(e)
+            finally:
+                if full and not measured and HOST_SAMPLE_CHANNELS > 0:
+                    with host_lock:
+                        host_sampling[host] -= 1  # 代表频道失效，让出名额给同主机后续频道
                 checked[0] += 1
+                controller.record(time.monotonic() - start, error)
+                controller.release()
             task_queue.task_done()
-    task_queue = Queue()
-    results = []
+    task_queue = Queue(maxsize=SPEED_MAX_WORKERS * 2)
+    alive = []
+    samples = []
+    host_lock = Lock()
+    host_sampling = {}
+    host_locks = {}
+    host_speeds = {}
+    host_ratios = {}
+    refreshes = []
     checked = [0]
+    queued = [0]
+    finished = Event()
+    # 起步20并发，线程按上限创建，实际同时测速的数量由控制器决定
+    controller = autotune.AIMDController("测速", 20, maximum=SPEED_MAX_WORKERS)
     Thread(target=show_progress, daemon=True).start()
-    for _ in range(20):    # 创建多个工作线程
+    for _ in range(controller.maximum):    # 创建多个工作线程
         Thread(target=worker, daemon=True).start()
     for channel in channels:
+        queued[0] += 1
         task_queue.put(channel)
     task_queue.join()
+    finished.set()
+    # 同一主机的频道使用代表频道测得速度的中位数；主机没有成功完整测速时记为未测速（速度0，排在已测速的源之后），
+    # 抽查只读几KB，算出的速度不代表带宽
+    host_median = {host: sorted(speeds)[len(speeds) // 2] for host, speeds in host_speeds.items()}
+    # HLS模式下代表频道的实时倍率中位数跟不上播放的主机，其余频道一并剔除
+    host_ratio = {host: sorted(ratios)[len(ratios) // 2] for host, ratios in host_ratios.items()}
+    results = []
+    dropped = 0
+    unmeasured = set()
+    for channel_name, channel_url, host, speed in alive:
+        if host_ratio.get(host, HLS_MIN_RATIO) < HLS_MIN_RATIO:
+            dropped += 1
+            continue
+        if HOST_SAMPLE_CHANNELS <= 0:
+            normalized_speed = max(speed, 0.001)
+        elif host in host_median:
+            normalized_speed = max(host_median[host], 0.001)
+        else:
+            normalized_speed = 0.0
+            unmeasured.add(host)
+        results.append((channel_name, channel_url, f"{normalized_speed:.3f}"))
+    if host_speeds and HOST_SAMPLE_CHANNELS > 0:
+        print(f"按主机测速：{len(host_speeds)}个主机完整测速{len(samples)}个频道，其余{len(alive) - len(samples)}个频道仅抽查存活")
+    if unmeasured:
+        print(f"{len(unmeasured)}个主机没有代表频道完整测速成功，其频道记为未测速")
+    if host_ratio:
+        ratios = sorted(ratio for ratios in host_ratios.values() for ratio in ratios)
+        print(f"HLS探测：实时倍率中位数{ratios[len(ratios) // 2]:.2f}，播放列表刷新延迟中位数{sorted(refreshes)[len(refreshes) // 2]:.3f}秒，"
+              f"{dropped}个频道因所在主机跟不上实时播放被剔除")
+    if samples:
+        ttfbs = sorted(sample[0] for sample in samples)
+        speeds = sorted(sample[1] for sample in samples)
+        print(f"测速统计：首字节耗时中位数{ttfbs[len(ttfbs) // 2]:.3f}秒，"
+              f"持续吞吐中位数{speeds[len(speeds) // 2]:.3f}MB/s，共下载{sum(sample[2] for sample in samples) / 1024 / 1024:.1f}MB")
     return results
 # 替换关键词以规范频道名
 def unify_channel_name(channels_list):
@@ -252,23 +608,61 @@ def classify_channels(input_file, output_file, keywords):
     with open(output_file, 'w', encoding='utf-8') as out_file:
         out_file.write(f"{keywords_list[0]},#genre#\n")  # 写入头部信息
         out_file.writelines(extracted_lines)  # 写入提取的行    
+# 存活记录库：先复检历史有效url，覆盖率不足时才整段扫描
+USE_LIVE_DB = os.environ.get("IPTV_LIVE_DB", "1") == "1"
+def split_url(url):
+    ip_port = url.split('/')[2]
+    return ip_port, url[len(f"http://{ip_port}"):]
+# 复检配置范围内的历史有效url，返回 (仍存活的url列表, 是否需要整段扫描)
+def verify_known(db, group, ip_configs):
+    known = []
+    for ip_port, url_end in livedb.known_hosts(db, group):
+        ip, port = ip_port.split(':')
+        a, b, c, d = ip.split('.')
+        if (f"{a}.{b}.{c}.1", port) in ip_configs:
+            known.append((ip_port, url_end))
+    if not known:
+        return [], True
+    controller = autotune.AIMDController("复检", 100, maximum=SCAN_MAX_WORKERS)
+    with ThreadPoolExecutor(max_workers=controller.maximum) as executor:
+        results = list(executor.map(lambda item: controller.run(check_ip_port, *item, controller), known))
+    alive = [item for item, result in zip(known, results) if result]
+    dead = [item for item, result in zip(known, results) if not result]
+    livedb.record_checks(db, group, alive, dead)
+    need_sweep = livedb.need_sweep(db, group, len(known), len(alive))
+    print(f"复检历史有效url {len(alive)}/{len(known)}个存活，{'需要' if need_sweep else '无需'}整段扫描")
+    return [result for result in results if result], need_sweep
 # 获取酒店源流程        
 def hotel_iptv(config_file):
     ip_configs = set(read_config(config_file))
+    group = os.path.basename(config_file)
+    db = livedb.open_db() if USE_LIVE_DB else None
     valid_urls = []
-    channels = []
-    configs =[]
+    need_sweep = True
+    if db is not None:
+        # 上次运行保存的网段RTT，本次样本攒够之前先用它设置超时
+        rtt_connect.known.update(livedb.load_rtt(db, "connect"))
+        rtt_read.known.update(livedb.load_rtt(db, "read"))
+        valid_urls, need_sweep = verify_known(db, group, ip_configs)
     url_ends = ["/iptv/live/1000.json?key=txiptv", "/ZHGXTV/Public/json/live_interface.txt"]
-    for url_end in url_ends:
-        for ip, port in ip_configs:
-            configs.append((ip, port, url_end))
-    for ip, port, url_end in configs:
-        valid_urls.extend(scan_ip_port(ip, port, url_end))
+    # 流水线：复检存活的url先进入提取；需要整段扫描时，扫到一个url就提取一个，提取出的频道立即测速
+    def iter_valid_urls():
+        yield from list(valid_urls)
+        if need_sweep:
+            for url in scan_ip_port(ip_configs, url_ends):
+                if url not in valid_urls:
+                    valid_urls.append(url)
+                    yield url
+    print("开始扫描、提取频道并测速")
+    results = speed_test(iter_extracted_channels(iter_valid_urls()))
     print(f"扫描完成，获取有效url共：{len(valid_urls)}个")
-    for valid_url in valid_urls:
-        channels.extend(extract_channels(valid_url))
-    print(f"共获取频道：{len(channels)}个\n开始测速")
-    results = speed_test(channels)
+    if db is not None:
+        if need_sweep:
+            livedb.record_checks(db, group, [split_url(url) for url in valid_urls], [])
+            livedb.record_sweep(db, group)
+        livedb.save_rtt(db, "connect", rtt_connect.estimates())
+        livedb.save_rtt(db, "read", rtt_read.estimates())
+        db.close()
     # 对频道进行排序
     results.sort(key=lambda x: -float(x[2]))
     results.sort(key=lambda x: channel_key(x[0]))
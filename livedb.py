@@ -0,0 +1,217 @@
+import os
+import time
+import sqlite3
+
+# ==================== 存活记录库（zubo.py / iptv.py / DL.py共用） ====================
+# 记录每个曾经扫描到的 host:port，下次运行先复检已知主机，覆盖率不足时才回退到整段扫描
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_FILE = os.environ.get("LIVE_DB_FILE", os.path.join(BASE_DIR, "ip", "live.db"))
+MAX_FAILURES = 3          # 连续失败次数达到该值的主机不再复检
+MIN_COVERAGE = 0.5        # 复检存活比例低于该值时回退到整段扫描
+SWEEP_INTERVAL = 7 * 24 * 3600  # 距上次整段扫描超过该时长（秒）时强制重新扫描
+
+def open_db(db_file=DB_FILE):
+    """打开（不存在则创建）存活记录库"""
+    os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+    db = sqlite3.connect(db_file)
+    db.executescript("""
+        CREATE TABLE IF NOT EXISTS hosts (
+            grp TEXT NOT NULL,
+            ip_port TEXT NOT NULL,
+            url_end TEXT NOT NULL,
+            first_seen REAL NOT NULL,
+            last_seen REAL NOT NULL,
+            last_checked REAL NOT NULL,
+            failures INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (grp, ip_port, url_end)
+        );
+        CREATE TABLE IF NOT EXISTS sweeps (
+            grp TEXT PRIMARY KEY,
+            last_sweep REAL NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS snapshots (
+            grp TEXT NOT NULL,
+            taken REAL NOT NULL,
+            prefix TEXT NOT NULL,
+            port TEXT NOT NULL,
+            bits BLOB NOT NULL,
+            PRIMARY KEY (grp, taken, prefix, port)
+        );
+        CREATE TABLE IF NOT EXISTS rtt (
+            subnet TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            p95 REAL NOT NULL,
+            samples INTEGER NOT NULL,
+            updated REAL NOT NULL,
+            PRIMARY KEY (subnet, kind)
+        );
+        CREATE TABLE IF NOT EXISTS loads (
+            ip_port TEXT PRIMARY KEY,
+            clients INTEGER,
+            mbps REAL,
+            uptime REAL,
+            updated REAL NOT NULL
+        );
+    """)
+    return db
+
+def known_hosts(db, grp):
+    """返回分组内仍值得复检的 (ip_port, url_end)，最久未检查的排在前面"""
+    rows = db.execute(
+        "SELECT ip_port, url_end FROM hosts WHERE grp = ? AND failures < ? ORDER BY last_checked",
+        (grp, MAX_FAILURES),
+    )
+    return rows.fetchall()
+
+def record_checks(db, grp, alive, dead):
+    """批量写入检测结果：alive/dead 均为 (ip_port, url_end) 列表"""
+    now = time.time()
+    db.executemany(
+        """INSERT INTO hosts (grp, ip_port, url_end, first_seen, last_seen, last_checked, failures)
+           VALUES (?, ?, ?, ?, ?, ?, 0)
+           ON CONFLICT (grp, ip_port, url_end)
+           DO UPDATE SET last_seen = excluded.last_seen, last_checked = excluded.last_checked, failures = 0""",
+        [(grp, ip_port, url_end, now, now, now) for ip_port, url_end in alive],
+    )
+    db.executemany(
+        "UPDATE hosts SET last_checked = ?, failures = failures + 1 WHERE grp = ? AND ip_port = ? AND url_end = ?",
+        [(now, grp, ip_port, url_end) for ip_port, url_end in dead],
+    )
+    db.commit()
+
+def record_sweep(db, grp):
+    """记录分组完成了一次整段扫描"""
+    db.execute(
+        "INSERT INTO sweeps (grp, last_sweep) VALUES (?, ?) ON CONFLICT (grp) DO UPDATE SET last_sweep = excluded.last_sweep",
+        (grp, time.time()),
+    )
+    db.commit()
+
+def need_sweep(db, grp, known_count, alive_count):
+    """判断复检后是否仍需整段扫描：无历史、覆盖率下降或距上次扫描过久"""
+    if known_count == 0 or alive_count == 0:
+        return True
+    if alive_count / known_count < MIN_COVERAGE:
+        return True
+    row = db.execute("SELECT last_sweep FROM sweeps WHERE grp = ?", (grp,)).fetchone()
+    return row is None or time.time() - row[0] > SWEEP_INTERVAL
+
+# ==================== 扫描结果位图快照 ====================
+# 每个 (a.b, 端口) 用一个 65536 位（8 KiB）的位图记录存活主机，第 c*256+d 位对应 a.b.c.d
+# 位图以Python整数参与运算，并集/交集/差集都是一次位运算
+SNAPSHOT_KEEP = 30        # 每个分组保留的历史快照次数
+
+def ip_ports_to_bitmaps(ip_ports):
+    """把 a.b.c.d:port 列表转成 {(a.b, port): 位图整数}"""
+    bitmaps = {}
+    for ip_port in ip_ports:
+        ip, port = ip_port.split(':')
+        a, b, c, d = ip.split('.')
+        key = (f"{a}.{b}", port)
+        bitmaps[key] = bitmaps.get(key, 0) | (1 << (int(c) * 256 + int(d)))
+    return bitmaps
+
+def bitmap_indexes(bits):
+    """按从小到大遍历位图中置位的序号（c*256+d）"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+def bitmap_ip_ports(prefix, port, bits):
+    """遍历位图中置位的主机，返回 a.b.c.d:port 列表"""
+    return [f"{prefix}.{index >> 8}.{index & 0xff}:{port}" for index in bitmap_indexes(bits)]
+
+def save_snapshot(db, grp, bitmaps):
+    """保存一次扫描结果快照，并清理超出SNAPSHOT_KEEP的旧快照"""
+    now = time.time()
+    db.executemany(
+        "INSERT INTO snapshots (grp, taken, prefix, port, bits) VALUES (?, ?, ?, ?, ?)",
+        [(grp, now, prefix, port, bits.to_bytes(8192, "little")) for (prefix, port), bits in bitmaps.items()],
+    )
+    # 没有结果的运行也记一条空快照，保证"丢失主机"能被统计到
+    if not bitmaps:
+        db.execute("INSERT INTO snapshots (grp, taken, prefix, port, bits) VALUES (?, ?, '', '', ?)",
+                   (grp, now, b""))
+    db.execute(
+        """DELETE FROM snapshots WHERE grp = ? AND taken NOT IN
+           (SELECT DISTINCT taken FROM snapshots WHERE grp = ? ORDER BY taken DESC LIMIT ?)""",
+        (grp, grp, SNAPSHOT_KEEP),
+    )
+    db.commit()
+
+def load_snapshots(db, grp, count=2):
+    """读取分组最近count次快照，新的在前：[{(a.b, port): 位图整数}, ...]"""
+    times = [row[0] for row in db.execute(
+        "SELECT DISTINCT taken FROM snapshots WHERE grp = ? ORDER BY taken DESC LIMIT ?", (grp, count))]
+    snapshots = []
+    for taken in times:
+        rows = db.execute("SELECT prefix, port, bits FROM snapshots WHERE grp = ? AND taken = ? AND prefix != ''",
+                          (grp, taken))
+        snapshots.append({(prefix, port): int.from_bytes(bits, "little") for prefix, port, bits in rows})
+    return snapshots
+
+def history_bitmaps(db, grp):
+    """分组全部保留快照的并集，供扫描器按历史排序探测顺序"""
+    return union_bitmaps(*load_snapshots(db, grp, SNAPSHOT_KEEP))
+
+def union_bitmaps(*snapshots):
+    """多次快照按 (a.b, port) 取并集"""
+    merged = {}
+    for snapshot in snapshots:
+        for key, bits in snapshot.items():
+            merged[key] = merged.get(key, 0) | bits
+    return merged
+
+def diff_snapshots(old, new):
+    """对比两次快照，返回新增/丢失/保持的主机数和变动率"""
+    added = lost = kept = 0
+    for key in set(old) | set(new):
+        old_bits, new_bits = old.get(key, 0), new.get(key, 0)
+        added += (new_bits & ~old_bits).bit_count()
+        lost += (old_bits & ~new_bits).bit_count()
+        kept += (old_bits & new_bits).bit_count()
+    total = added + lost + kept
+    return {"added": added, "lost": lost, "kept": kept, "churn": (added + lost) / total if total else 0.0}
+
+# ==================== 网段RTT估计 ====================
+# 按 a.b.c 网段保存连接/响应耗时的p95，下次运行在样本攒够之前先用它设置超时
+RTT_MAX_AGE = 7 * 24 * 3600  # 超过该时长（秒）未更新的估计不再使用
+
+def load_rtt(db, kind):
+    """读取某类耗时（connect/read）的网段估计：{网段: p95}"""
+    rows = db.execute("SELECT subnet, p95 FROM rtt WHERE kind = ? AND updated > ?",
+                      (kind, time.time() - RTT_MAX_AGE))
+    return dict(rows.fetchall())
+
+def save_rtt(db, kind, estimates):
+    """写入本次运行的网段估计：estimates为 {网段: (p95, 样本数)}"""
+    now = time.time()
+    db.executemany(
+        """INSERT INTO rtt (subnet, kind, p95, samples, updated) VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT (subnet, kind) DO UPDATE SET p95 = excluded.p95, samples = excluded.samples, updated = excluded.updated""",
+        [(subnet, kind, p95, samples, now) for subnet, (p95, samples) in estimates.items()],
+    )
+    db.commit()
+
+# ==================== udpxy负载 ====================
+# 扫描时从udpxy状态页解析出的客户端数、总转发带宽（Mbit/s）和运行时长（秒），解析不到的字段为NULL
+LOAD_MAX_AGE = 24 * 3600  # 负载随时间变化，超过该时长（秒）的记录不再使用
+
+def save_loads(db, loads):
+    """写入本次扫描到的负载：loads为 {ip_port: {"clients": 客户端数, "mbps": 带宽, "uptime": 运行秒数}}"""
+    now = time.time()
+    db.executemany(
+        """INSERT INTO loads (ip_port, clients, mbps, uptime, updated) VALUES (?, ?, ?, ?, ?)
+           ON CONFLICT (ip_port) DO UPDATE SET clients = excluded.clients, mbps = excluded.mbps,
+           uptime = excluded.uptime, updated = excluded.updated""",
+        [(ip_port, load.get("clients"), load.get("mbps"), load.get("uptime"), now) for ip_port, load in loads.items()],
+    )
+    db.commit()
+
+def load_loads(db):
+    """读取最近的负载记录：{ip_port: {"clients": ..., "mbps": ..., "uptime": ..., "updated": 记录时间}}"""
+    rows = db.execute("SELECT ip_port, clients, mbps, uptime, updated FROM loads WHERE updated > ?",
+                      (time.time() - LOAD_MAX_AGE,))
+    return {ip_port: {"clients": clients, "mbps": mbps, "uptime": uptime, "updated": updated}
+            for ip_port, clients, mbps, uptime, updated in rows}
@@ -0,0 +1,334 @@
+import time
+import socket
+import struct
+import asyncio
+from urllib.parse import urlparse
+import requests
+import httpclient
+
+# ==================== MPEG-TS流稳定性分析（DL.py使用） ====================
+# 直接读取HTTP/udpxy输出的TS流，按188字节包解析：同步字节、连续计数器(CC)、PCR/PTS时间戳和不连续标志，
+# 不启动ffprobe进程、不解码，每路流只占一个线程和几十KB内存
+TS_PACKET_SIZE = 188
+TS_SYNC = 0x47
+NULL_PID = 0x1fff
+CLOCK = 90000             # PTS以及PCR基准部分的时钟频率（Hz）
+WRAP = 1 << 33            # PTS/PCR基准为33位，约26.5小时回绕一次
+RTP_WRAP = 1 << 32        # RTP时间戳为32位，90kHz下约13.3小时回绕一次
+BACKWARD_LIMIT = 1.0      # 时间戳回退超过该值（秒）视为断流重连，与ffprobe检测的判断一致
+GAP_LIMIT = 5.0           # 时间戳前跳超过该值（秒）视为断流
+STALL_LIMIT = 5.0         # 媒体时间落后实际时间超过该值（秒）视为卡顿
+MAX_CC_ERROR_RATIO = 0.01  # 连续计数器错误（丢包）占比上限
+MAX_SYNC_LOSS_RATIO = 0.01  # 失步丢弃的字节占比上限
+MAX_RTP_LOSS_RATIO = 0.01   # RTP序号丢包占比上限
+MULTICAST_RCVBUF = 2 * 1024 * 1024  # 组播socket接收缓冲，容纳事件循环繁忙时的突发
+
+class TSAnalyzer:
+    """增量分析TS字节流：feed()喂入任意长度的数据，verdict()给出稳定性结论"""
+
+    def __init__(self):
+        self.buffer = b""
+        self.bytes = 0
+        self.packets = 0
+        self.skipped = 0          # 失步时丢弃的字节数
+        self.cc_errors = 0
+        self.discontinuities = 0  # 适配域中的不连续标志
+        self.backward_jumps = 0
+        self.forward_gaps = 0
+        self.first_time = None    # 第一个时间戳（秒，已展开回绕）
+        self.last_time = None
+        self._media_key = None
+        self._cc = {}
+        self._clock = {}          # 每个PID最近一次PCR/PTS（90kHz，未展开）
+        self._unwrapped = {}      # 每个PID展开回绕后的最近时间（秒）
+
+    def feed(self, data):
+        buffer = self.buffer + data
+        self.bytes += len(data)
+        offset = 0
+        end = len(buffer)
+        while end - offset >= TS_PACKET_SIZE:
+            if buffer[offset] != TS_SYNC:
+                offset = self._resync(buffer, offset)
+                continue
+            # 快速路径：一整段都对齐时逐包解析包头，不再逐字节检查同步
+            count = (end - offset) // TS_PACKET_SIZE
+            aligned = buffer[offset:offset + count * TS_PACKET_SIZE]
+            if aligned[::TS_PACKET_SIZE].count(TS_SYNC) != count:
+                count = next(i for i in range(count) if aligned[i * TS_PACKET_SIZE] != TS_SYNC)
+            for position in range(offset, offset + count * TS_PACKET_SIZE, TS_PACKET_SIZE):
+                self._packet(buffer, position)
+            offset += count * TS_PACKET_SIZE
+        self.buffer = buffer[offset:]
+
+    def _resync(self, buffer, offset):
+        # 找到连续两个包起始都是0x47的位置，中间的字节计为失步丢弃
+        position = buffer.find(bytes([TS_SYNC]), offset + 1)
+        while position != -1 and position + TS_PACKET_SIZE < len(buffer) and buffer[position + TS_PACKET_SIZE] != TS_SYNC:
+            position = buffer.find(bytes([TS_SYNC]), position + 1)
+        if position == -1:
+            position = len(buffer)
+        self.skipped += position - offset
+        return position
+
+    def _packet(self, data, offset):
+        self.packets += 1
+        flags = data[offset + 1]
+        pid = ((flags & 0x1f) << 8) | data[offset + 2]
+        if pid == NULL_PID:
+            return
+        control = data[offset + 3]
+        has_adaptation = control & 0x20
+        has_payload = control & 0x10
+        payload = offset + 4
+        discontinuity = False
+        if has_adaptation:
+            length = data[offset + 4]
+            payload += 1 + length
+            if length:
+                adaptation_flags = data[offset + 5]
+                discontinuity = bool(adaptation_flags & 0x80)
+                if discontinuity:
+                    self.discontinuities += 1
+                if adaptation_flags & 0x10 and length >= 7:
+                    pcr = data[offset + 6:offset + 11]
+                    base = (pcr[0] << 25) | (pcr[1] << 17) | (pcr[2] << 9) | (pcr[3] << 1) | (pcr[4] >> 7)
+                    self._timestamp(("pcr", pid), base, discontinuity)
+        if has_payload:
+            counter = control & 0x0f
+            last = self._cc.get(pid)
+            # 重复包（CC相同）允许出现一次；有不连续标志时计数器可以重置
+            if last is not None and not discontinuity and counter != last and counter != (last + 1) & 0x0f:
+                self.cc_errors += 1
+            self._cc[pid] = counter
+            if flags & 0x40 and payload + 14 <= offset + TS_PACKET_SIZE:
+                self._pes(data, payload, pid, discontinuity)
+
+    def _pes(self, data, offset, pid, discontinuity):
+        # 只看音视频PES（stream_id 0xC0-0xEF）的PTS
+        if data[offset:offset + 3] != b"\x00\x00\x01" or not 0xc0 <= data[offset + 3] <= 0xef:
+            return
+        if data[offset + 7] & 0x80:
+            pts = data[offset + 9:offset + 14]
+            value = ((pts[0] >> 1) & 0x07) << 30 | pts[1] << 22 | (pts[2] >> 1) << 15 | pts[3] << 7 | pts[4] >> 1
+            self._timestamp(("pts", pid), value, discontinuity)
+
+    def _timestamp(self, key, value, discontinuity):
+        last = self._clock.get(key)
+        self._clock[key] = value
+        if last is None:
+            seconds = self._unwrapped.get(key, value / CLOCK)
+        elif discontinuity:
+            # 不连续标志表示码流主动声明的时基切换，不算断流：以新时间戳为基准重新计数，媒体时间不跳变
+            seconds = self._unwrapped[key]
+        else:
+            delta = (value - last) % WRAP
+            if delta > WRAP // 2:
+                delta -= WRAP
+            delta /= CLOCK
+            seconds = self._unwrapped[key] + delta
+            if delta < -BACKWARD_LIMIT:
+                self.backward_jumps += 1
+            elif delta > GAP_LIMIT:
+                self.forward_gaps += 1
+        self._unwrapped[key] = seconds
+        # 媒体时间只跟踪第一个出现时间戳的PID，避免音视频时基差异互相干扰
+        if self.first_time is None:
+            self._media_key = key
+            self.first_time = seconds
+        if key == self._media_key:
+            self.last_time = seconds
+
+    def media_seconds(self):
+        """已收到的媒体时长（秒）"""
+        if self.first_time is None:
+            return 0.0
+        return self.last_time - self.first_time
+
+    def verdict(self, wall_seconds):
+        """返回(是否稳定, 原因)；wall_seconds为实际读取时长"""
+        if not self.packets:
+            return False, "没有收到TS包"
+        if self.skipped > self.bytes * MAX_SYNC_LOSS_RATIO:
+            return False, f"失步丢弃{self.skipped}字节"
+        if self.first_time is None:
+            return False, "没有PCR/PTS时间戳"
+        if self.backward_jumps:
+            return False, f"时间戳回退{self.backward_jumps}次"
+        if self.forward_gaps:
+            return False, f"时间戳中断{self.forward_gaps}次"
+        if self.cc_errors > self.packets * MAX_CC_ERROR_RATIO:
+            return False, f"连续计数错误{self.cc_errors}/{self.packets}"
+        if wall_seconds - self.media_seconds() > STALL_LIMIT:
+            return False, f"{wall_seconds:.1f}秒只收到{self.media_seconds():.1f}秒媒体数据"
+        return True, f"{self.packets}包，媒体{self.media_seconds():.1f}秒，CC错误{self.cc_errors}"
+
+def check_http_stream(url, duration, connect_timeout, stall_timeout=STALL_LIMIT, analyzer=None):
+    """读取HTTP TS流duration秒并分析，返回(是否稳定, 原因)；stall_timeout秒收不到数据即判为断流
+    传入analyzer时用它累计统计，调用方可事后查看收到的字节数等"""
+    analyzer = analyzer or TSAnalyzer()
+    try:
+        with httpclient.get(url, timeout=(connect_timeout, stall_timeout), stream=True) as resp:
+            resp.raise_for_status()
+            start = time.monotonic()
+            for chunk in resp.iter_content(TS_PACKET_SIZE * 64):
+                analyzer.feed(chunk)
+                if time.monotonic() - start >= duration:
+                    break
+            else:
+                return False, f"{time.monotonic() - start:.1f}秒后流结束"
+    except requests.RequestException as e:
+        return False, f"读取失败：{type(e).__name__}"
+    return analyzer.verdict(time.monotonic() - start)
+
+# ==================== 组播直收（RTP/UDP） ====================
+# 在运营商网络内直接加入组播组，收一小段时间的RTP/UDP包：统计包速率、RTP序号丢包、到达抖动（RFC 3550），
+# 载荷交给TSAnalyzer检查连续计数和时间戳；所有组播组共用一个事件循环，每组只占一个socket
+def parse_multicast_url(url):
+    """udp://[@]组:端口、rtp://[@]组:端口，以及udpxy地址 http://主机/rtp/组:端口 → (组, 端口)；不是组播地址返回None"""
+    parsed = urlparse(url)
+    if parsed.scheme in ("udp", "rtp"):
+        address = parsed.netloc.rsplit("@", 1)[-1]
+    elif parsed.scheme == "http" and parsed.path.startswith(("/rtp/", "/udp/")):
+        address = parsed.path[5:]
+    else:
+        return None
+    group, _, port = address.partition(":")
+    try:
+        if not 224 <= socket.inet_aton(group)[0] <= 239 or not port.isdigit():
+            return None
+    except OSError:
+        return None
+    return group, int(port)
+
+def open_multicast_socket(group, port, interface="0.0.0.0"):
+    """创建加入组播组的非阻塞UDP socket；interface为接收组播的本机网卡地址"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, MULTICAST_RCVBUF)
+        try:
+            sock.bind((group, port))  # Linux上绑定组地址，同端口的其他组播组不会混进来
+        except OSError:
+            sock.bind(("", port))
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP,
+                        struct.pack("4s4s", socket.inet_aton(group), socket.inet_aton(interface)))
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+class MulticastReceiver(asyncio.DatagramProtocol):
+    """统计一个组播组的收包情况；RTP包剥掉包头后把TS载荷交给TSAnalyzer，裸UDP直接交给TSAnalyzer"""
+
+    def __init__(self):
+        self.analyzer = TSAnalyzer()
+        self.datagrams = 0
+        self.first_arrival = None
+        self.last_arrival = None
+        self.max_gap = 0.0
+        self.rtp_received = 0
+        self.rtp_first = None     # 扩展序号（计入回绕）
+        self.rtp_highest = None
+        self.jitter = 0.0         # RTP时钟单位
+        self._transit = None
+
+    def datagram_received(self, data, addr):
+        now = time.monotonic()
+        if self.last_arrival is not None:
+            self.max_gap = max(self.max_gap, now - self.last_arrival)
+        else:
+            self.first_arrival = now
+        self.last_arrival = now
+        self.datagrams += 1
+        if len(data) >= 12 and data[0] & 0xc0 == 0x80:
+            payload = self._rtp(data, now)
+            if payload is not None:
+                self.analyzer.feed(payload)
+        elif data[:1] == bytes([TS_SYNC]):
+            self.analyzer.feed(data)
+
+    def _rtp(self, data, now):
+        csrc_count = data[0] & 0x0f
+        offset = 12 + 4 * csrc_count
+        if data[0] & 0x10:  # 扩展头
+            if len(data) < offset + 4:
+                return None
+            offset += 4 + 4 * struct.unpack_from("!H", data, offset + 2)[0]
+        end = len(data) - (data[-1] if data[0] & 0x20 else 0)  # 填充
+        if offset > end:
+            return None
+        sequence, timestamp = struct.unpack_from("!HI", data, 2)
+        self.rtp_received += 1
+        if self.rtp_highest is None:
+            self.rtp_first = self.rtp_highest = sequence
+        else:
+            delta = (sequence - self.rtp_highest) & 0xffff
+            if 0 < delta < 0x8000:  # 前进（含回绕）；乱序和重复包不移动最高序号
+                self.rtp_highest += delta
+        # 到达抖动：到达时间与RTP时间戳之差的变化量做1/16平滑，MP2T的RTP时钟为90kHz
+        transit = now * CLOCK - timestamp
+        if self._transit is not None:
+            # 时间戳回绕时按32位取模，折回有符号范围后再取绝对值
+            difference = (transit - self._transit) % RTP_WRAP
+            if difference >= RTP_WRAP // 2:
+                difference -= RTP_WRAP
+            self.jitter += (abs(difference) - self.jitter) / 16
+        self._transit = transit
+        return data[offset:end]
+
+    def rtp_lost(self):
+        """按RFC 3550：期望收到的包数减去实际收到的包数"""
+        if self.rtp_highest is None:
+            return 0, 0
+        expected = self.rtp_highest - self.rtp_first + 1
+        return max(0, expected - self.rtp_received), expected
+
+    def summary(self, wall_seconds):
+        lost, expected = self.rtp_lost()
+        parts = [f"{self.datagrams / max(wall_seconds, 0.001):.0f}包/秒"]
+        if expected:
+            parts.append(f"RTP丢包{lost / expected:.2%}")
+            parts.append(f"抖动{self.jitter / CLOCK * 1000:.1f}ms")
+        parts.append(f"CC错误{self.analyzer.cc_errors}")
+        return "，".join(parts)
+
+    def verdict(self, wall_seconds):
+        """返回(是否稳定, 原因)"""
+        if not self.datagrams:
+            return False, "没有收到组播数据"
+        summary = self.summary(wall_seconds)
+        lost, expected = self.rtp_lost()
+        if expected and lost > expected * MAX_RTP_LOSS_RATIO:
+            return False, f"RTP丢包过多（{summary}）"
+        if self.max_gap > STALL_LIMIT:
+            return False, f"{self.max_gap:.1f}秒没有收到数据（{summary}）"
+        stable, reason = self.analyzer.verdict(wall_seconds)
+        return stable, summary if stable else f"{reason}（{summary}）"
+
+async def check_multicast(url, duration, interface="0.0.0.0", stall_timeout=STALL_LIMIT):
+    """加入组播组收duration秒并分析，返回(是否稳定, 原因, 是否收到过数据)；stall_timeout秒收不到数据即提前结束"""
+    address = parse_multicast_url(url)
+    if address is None:
+        return False, "不是组播地址", False
+    loop = asyncio.get_running_loop()
+    try:
+        sock = open_multicast_socket(*address, interface)
+    except OSError as e:
+        return False, f"加入组播失败：{e.strerror or e}", False
+    transport, receiver = await loop.create_datagram_endpoint(MulticastReceiver, sock=sock)
+    start = time.monotonic()
+    try:
+        while time.monotonic() - start < duration:
+            await asyncio.sleep(min(0.5, duration - (time.monotonic() - start)))
+            # 还没收到过数据时从开始收听算起
+            if time.monotonic() - (receiver.last_arrival or start) > stall_timeout:
+                break
+    finally:
+        transport.close()  # 关闭socket即退出组播组
+    end = time.monotonic()
+    if receiver.last_arrival is not None:
+        receiver.max_gap = max(receiver.max_gap, end - receiver.last_arrival)
+    stable, reason = receiver.verdict(end - start)
+    return stable, reason, receiver.datagrams > 0
@@ -1,260 +1,1266 @@
-from threading import Thread, Lock, Event
-import os
-import time
-import datetime
-import glob
-import requests
-from concurrent.futures import ThreadPoolExecutor, as_completed
-
-def read_config(config_file):
-    print(f"读取设置文件：{config_file}")
-    ip_configs = []
-    try:
-        with open(config_file, 'r', encoding='utf-8') as f:
-            for line_num, line in enumerate(f, 1):
-                if "," in line and not line.startswith("#"):
-                    parts = line.strip().split(',')
-                    ip_part, port = parts[0].strip().split(':')
-                    a, b, c, d = ip_part.split('.')
-                    option = int(parts[1]) 
-                    url_end = "/status" if option >= 10 else "/stat"
-                    ip = f"{a}.{b}.{c}.1" if option % 2 == 0 else f"{a}.{b}.1.1"
-                    ip_configs.append((ip, port, option, url_end))
-                    print(f"第{line_num}行：http://{ip}:{port}{url_end}添加到扫描列表")
-        return ip_configs
-    except Exception as e:
-        print(f"读取文件错误: {e}")
-        return []
-
-def generate_ip_ports(ip, port, option):
-    a, b, c, d = ip.split('.')
-    if option == 2 or option == 12:
-        c_extent = c.split('-')
-        c_first = int(c_extent[0]) if len(c_extent) == 2 else int(c)
-        c_last = int(c_extent[1]) + 1 if len(c_extent) == 2 else int(c) + 8
-        return [f"{a}.{b}.{x}.{y}:{port}" for x in range(c_first, c_last) for y in range(1, 256)]
-    elif option == 0 or option == 10:
-        return [f"{a}.{b}.{c}.{y}:{port}" for y in range(1, 256)]
-    else:  # option=11 全网段扫描
-        return [f"{a}.{b}.{x}.{y}:{port}" for x in range(256) for y in range(1, 256)]
-
-# 核心优化：移除开头冗余检测，保留首匹配即停核心逻辑，减少线程内开销
-def check_ip_port(ip_port, url_end, option, stop_flag, found_ip, ip_lock, progress_stop_event):    
-    try:
-        url = f"http://{ip_port}{url_end}"
-        # 保留海外适配的网络配置，超时3秒适配网络延迟
-        resp = requests.get(url, timeout=3, verify=False, allow_redirects=False)
-        resp.raise_for_status()
-        if "Multi stream daemon" in resp.text or "udpxy status" in resp.text:
-            print(f"{url} 访问成功")
-            # 规则11专属：找到第一个有效IP立即触发停止信号
-            if option == 11:
-                with ip_lock:
-                    found_ip[0] = ip_port  # 加锁保证线程安全，避免数据污染
-                stop_flag.set()  # 标记扫描停止
-                progress_stop_event.set()  # 终止进度打印线程
-            return ip_port
-    except Exception as e:
-        return None
-
-# 核心优化：恢复300并发数、批量检测停止信号、简化进度判断，拉满扫描速度
-def scan_ip_port(ip, port, option, url_end):
-    # 每次扫描独立创建状态，彻底隔离，避免多省份扫描状态污染
-    stop_flag = Event()
-    found_ip = [None]
-    ip_lock = Lock()
-    progress_stop_event = Event()
-    
-    # 优化进度打印：简化判断条件，减少循环内开销，保留精准终止
-    def show_progress(checked, total, stop_flag, progress_stop_event):
-        while not progress_stop_event.is_set() and checked[0] < total and option % 2 == 1:
-            count = 1 if found_ip[0] else 0
-            print(f"已扫描：{checked[0]}/{total}, 有效ip_port：{count}个")
-            # 每1秒检测一次终止信号，保证快速停止
-            for _ in range(30):
-                if progress_stop_event.is_set() or stop_flag.is_set():
-                    return
-                time.sleep(1)
-    
-    valid_ip_ports = []
-    ip_ports = generate_ip_ports(ip, port, option)
-    if not ip_ports:
-        print(f"⚠️  未生成待扫描IP（{ip}:{port}）")
-        return valid_ip_ports
-    
-    checked = [0]
-    # 启动进度打印线程，后台运行不阻塞主扫描
-    progress_thread = Thread(target=show_progress, args=(checked, len(ip_ports), stop_flag, progress_stop_event), daemon=True)
-    progress_thread.start()
-    
-    # 核心优化：恢复和第一段一致的300并发数，拉满并行扫描速度
-    max_workers = 300 if option % 2 == 1 else 150
-    executor = ThreadPoolExecutor(max_workers=max_workers)
-    futures = {}
-    
-    # 核心优化：批量检测停止信号（每遍历一次判断一次，减少98%串行判断开销）
-    for ip_port in ip_ports:
-        # 规则11：检测到停止信号立即停止提交新任务
-        if option == 11 and stop_flag.is_set():
-            break
-        future = executor.submit(
-            check_ip_port, 
-            ip_port, url_end, option, 
-            stop_flag, found_ip, ip_lock, progress_stop_event
-        )
-        futures[future] = ip_port
-    
-    try:
-        for future in as_completed(futures):
-            # 规则11：找到有效IP后快速清理剩余任务，立即退出
-            if option == 11 and stop_flag.is_set():
-                progress_stop_event.set()
-                break
-            try:
-                result = future.result()
-                if result:
-                    valid_ip_ports.append(result)
-                checked[0] += 1
-            except Exception as e:
-                checked[0] += 1
-                continue
-    finally:
-        # 强制关闭线程池，取消未执行任务，防止资源泄漏
-        executor.shutdown(wait=False, cancel_futures=True)
-        progress_stop_event.set()
-        progress_thread.join(timeout=2)  # 等待进度线程退出，无残留
-    
-    # 规则11专属：只保留第一个有效IP，保证结果唯一性
-    if option == 11:
-        if found_ip[0] and found_ip[0] not in valid_ip_ports:
-            valid_ip_ports = [found_ip[0]]
-        valid_ip_ports = valid_ip_ports[:1]
-    
-    # 清理状态，防止内存泄漏
-    stop_flag.clear()
-    progress_stop_event.clear()
-    return valid_ip_ports
-
-def multicast_province(config_file):
-    filename = os.path.basename(config_file)
-    province = filename.split('_')[0]
-    print(f"\n{'='*50}")
-    print(f"开始扫描配置文件：{config_file}")
-    print(f"{'='*50}")
-    print(f"{'='*25}\n   获取: {province}ip_port\n{'='*25}")
-    configs = sorted(set(read_config(config_file)))
-    print(f"读取完成，共需扫描 {len(configs)}组")
-    all_ip_ports = []
-    
-    for ip, port, option, url_end in configs:
-        print(f"\n开始扫描  http://{ip}:{port}{url_end} (规则{option})")
-        scan_result = scan_ip_port(ip, port, option, url_end)
-        if scan_result:
-            all_ip_ports.extend(scan_result)
-            if option == 11:
-                print(f"✅ 规则{option}找到第一个有效IP：{scan_result[0]}，停止当前组扫描")
-            else:
-                print(f"✅ 规则{option}扫描完成，找到{len(scan_result)}个有效IP")
-        else:
-            print(f"❌ 规则{option}未找到有效IP")
-    
-    if len(all_ip_ports) != 0:
-        all_ip_ports = sorted(set(all_ip_ports))
-        print(f"\n{province} 扫描完成，获取有效ip_port共：{len(all_ip_ports)}个\n{all_ip_ports}\n")
-        
-        # 自动创建ip目录，避免首次运行报错
-        if not os.path.exists('ip'):
-            os.makedirs('ip', mode=0o755)
-        
-        # 写入有效IP文件，供后续脚本处理
-        with open(f"ip/{province}_ip.txt", 'w', encoding='utf-8') as f:
-            f.write('\n'.join(all_ip_ports))
-        
-        # 存档IP逻辑，保留历史有效IP
-        if os.path.exists(f"ip/存档_{province}_ip.txt"):
-            with open(f"ip/存档_{province}_ip.txt", 'r', encoding='utf-8') as f:
-                lines = f.readlines()
-            for ip_port in all_ip_ports:
-                ip, port = ip_port.split(":")
-                a, b, c, d = ip.split(".")
-                lines.append(f"{a}.{b}.{c}.1:{port}\n")
-            lines = sorted(set(lines))
-            with open(f"ip/存档_{province}_ip.txt", 'w', encoding='utf-8') as f:
-                f.writelines(lines)
-        
-        # 生成省份组播源文件，适配后续HB/DL/PX脚本
-        template_file = os.path.join('template', f"template_{province}.txt")
-        if os.path.exists(template_file):
-            with open(template_file, 'r', encoding='utf-8') as f:
-                tem_channels = f.read()
-            output = [] 
-            with open(f"ip/{province}_ip.txt", 'r', encoding='utf-8') as f:
-                for line in f:
-                    ip = line.strip()
-                    output.append(tem_channels.replace("ipipip", f"{ip}"))
-            with open(f"组播_{province}.txt", 'w', encoding='utf-8') as f:
-                f.writelines(output)
-        else:
-            print(f"缺少模板文件: {template_file}")
-    else:
-        print(f"\n{province} 扫描完成，未扫描到有效ip_port")
-
-def txt_to_m3u(input_file, output_file):
-    # 把txt格式组播源转为标准m3u格式，兼容各类播放器
-    with open(input_file, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
-    with open(output_file, 'w', encoding='utf-8') as f:
-        genre = ''
-        for line in lines:
-            line = line.strip()
-            if "," in line:
-                channel_name, channel_url = line.split(',', 1)
-                if channel_url == '#genre#':
-                    genre = channel_name
-                else:
-                    f.write(f'#EXTINF:-1 group-title="{genre}",{channel_name}\n')
-                    f.write(f'{channel_url}\n')
-
-def main():
-    # 自动创建ip/template目录，避免首次运行/目录删除后报错
-    for dir_name in ['ip', 'template']:
-        if not os.path.exists(dir_name):
-            os.makedirs(dir_name, mode=0o755)
-    
-    # 检测配置文件，无配置时友好提示并退出
-    config_files = glob.glob(os.path.join('ip', '*_config.txt'))
-    if not config_files:
-        print("⚠️  未找到ip目录下的*_config.txt配置文件，请检查目录和文件命名！")
-        return
-    
-    # 遍历扫描所有省份配置文件，间隔1秒防止资源未释放
-    for config_file in config_files:
-        time.sleep(1)
-        multicast_province(config_file)
-    
-    # 合并电信/联通组播源，生成总文件
-    file_contents = []
-    for file_path in glob.glob('组播_*电信.txt') + glob.glob('组播_*联通.txt'):
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding="utf-8") as f:
-                file_contents.append(f.read())
-    
-    # 生成总组播源txt和m3u文件，记录更新时间
-    now = datetime.datetime.now()
-    current_time = now.strftime("%Y/%m/%d %H:%M")
-    with open("zubo_all.txt", "w", encoding="utf-8") as f:
-        f.write(f"{current_time}更新,#genre#\n")
-        f.write(f"浙江卫视,http://ali-m-l.cztv.com/channels/lantian/channel001/1080p.m3u8\n")
-        f.write('\n'.join(file_contents))
-    
-    # 转换为m3u格式
-    txt_to_m3u("zubo_all.txt", "zubo_all.m3u")
-    print(f"\n🎉 组播地址获取完成，最终生成文件：")
-    print(f"   - 总组播源(TXT)：zubo_all.txt")
-    print(f"   - 总组播源(M3U)：zubo_all.m3u")
-
-if __name__ == "__main__":
-    # 禁用SSL证书警告，让日志更干净，无刷屏干扰
-    import urllib3
-    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
-    main()
+from threading import Thread, Lock, Event
+import os
+import time
+import datetime
+import glob
+import asyncio
+import collections
+import math
+import sys
+import json
+import re
+import hashlib
+import itertools
+import subprocess
+import socket
+import livedb
+import httpclient
+import autotune
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# 扫描引擎：thread=线程池+共用HTTP客户端（原有逻辑），asyncio=单线程协程，可同时保持数千个探测
+SCAN_ENGINE = os.environ.get("ZUBO_SCAN_ENGINE", "asyncio")
+# asyncio引擎同时在途的探测数上限（受系统文件描述符上限约束，见async_concurrency_limit）
+# 实际并发从ASYNC_INITIAL_CONCURRENCY起步，由AIMD控制器按超时/延迟自动增减
+ASYNC_CONCURRENCY = int(os.environ.get("ZUBO_ASYNC_CONCURRENCY", "2000"))
+ASYNC_INITIAL_CONCURRENCY = int(os.environ.get("ZUBO_ASYNC_INITIAL_CONCURRENCY", "500"))
+# 线程池引擎的线程数上限，起步并发沿用原来的300/150
+THREAD_MAX_WORKERS = int(os.environ.get("ZUBO_THREAD_MAX_WORKERS", "1000"))
+# 探测只读取响应开头：看到udpxy标记即停止，最多读PROBE_MAX_BYTES字节（含响应头）、PROBE_MAX_TIME秒
+# 避免下载整个状态页，甚至被错误配置的服务器重定向到直播流后一直读下去
+PROBE_MAX_BYTES = 8 * 1024
+PROBE_MAX_TIME = 5
+UDPXY_MARKERS = (b"Multi stream daemon", b"udpxy status")
+# 负载采集：命中标记后继续读完状态页（最多STATUS_MAX_BYTES），解析客户端数、转发带宽和运行时长存入存活记录库，
+# 供DL.py优先检测负载轻的udpxy、跳过已满的（ZUBO_STATUS_LOAD=0关闭，命中标记即停止读取）
+STATUS_LOAD = os.environ.get("ZUBO_STATUS_LOAD", "1") == "1"
+STATUS_MAX_BYTES = 64 * 1024
+server_loads = {}
+# 两阶段扫描：先对整个网段做TCP连接预筛（短超时），端口开放的地址才进入HTTP验证
+TCP_PREFILTER = os.environ.get("ZUBO_TCP_PREFILTER", "1") == "1"
+CONNECT_TIMEOUT = float(os.environ.get("ZUBO_CONNECT_TIMEOUT", "1"))
+# 自适应超时：按/24网段学习连接/响应耗时的p95，上面的固定超时只作为样本不足时的默认值（ZUBO_ADAPTIVE_TIMEOUT=0关闭）
+ADAPTIVE_TIMEOUT = os.environ.get("ZUBO_ADAPTIVE_TIMEOUT", "1") == "1"
+rtt_connect = autotune.SubnetTimeouts()
+rtt_read = autotune.SubnetTimeouts()
+# 跨省份合并扫描范围：同一C段在一次运行中只扫描一次
+MERGE_PROVINCES = os.environ.get("ZUBO_MERGE_PROVINCES", "1") == "1"
+# 存活记录库：先复检历史有效ip_port，覆盖率不足时才整段扫描（ZUBO_LIVE_DB=0关闭）
+USE_LIVE_DB = os.environ.get("ZUBO_LIVE_DB", "1") == "1"
+# 分片扫描的共享目录（多进程/多台机器挂载同一目录即可协同扫描同一省份）
+SHARD_DIR = os.environ.get("ZUBO_SHARD_DIR", os.path.join('ip', 'shards'))
+# 执行中的worker每SHARD_HEARTBEAT秒刷新一次领取标记，超过SHARD_CLAIM_TIMEOUT秒未刷新的分片可被其他worker接管
+SHARD_CLAIM_TIMEOUT = float(os.environ.get("ZUBO_SHARD_CLAIM_TIMEOUT", "600"))
+SHARD_HEARTBEAT = SHARD_CLAIM_TIMEOUT / 4
+# 断点续扫：定期把每组扫描进度和已找到的结果写入CHECKPOINT_DIR，--resume 或 ZUBO_RESUME=1 时从断点继续
+CHECKPOINT_DIR = os.path.join('ip', 'checkpoint')
+CHECKPOINT_INTERVAL = 30
+CHECKPOINT_VERSION = 2  # 探测顺序改变时递增，旧断点的序号不再对应同一批地址，自动作废
+RESUME = "--resume" in sys.argv or os.environ.get("ZUBO_RESUME") == "1"
+# 单次运行的扫描时间预算（秒，0为不限），用完后保存断点退出，便于拆成多次定时任务
+TIME_BUDGET = float(os.environ.get("ZUBO_TIME_BUDGET", "0"))
+# 规则11历史排序时优先尝试的常见主机号个数
+HOT_HOST_OCTETS = 16
+# 全局调度器对同一个/24每秒最多发起的探测数
+SUBNET_RATE = float(os.environ.get("ZUBO_SUBNET_RATE", "100"))
+
+def read_config(config_file):
+    print(f"读取设置文件：{config_file}")
+    ip_configs = []
+    try:
+        with open(config_file, 'r', encoding='utf-8') as f:
+            for line_num, line in enumerate(f, 1):
+                if "," in line and not line.startswith("#"):
+                    parts = line.strip().split(',')
+                    ip_part, port = parts[0].strip().split(':')
+                    a, b, c, d = ip_part.split('.')
+                    option = int(parts[1]) 
+                    url_end = "/status" if option >= 10 else "/stat"
+                    ip = f"{a}.{b}.{c}.1" if option % 2 == 0 else f"{a}.{b}.1.1"
+                    ip_configs.append((ip, port, option, url_end))
+                    print(f"第{line_num}行：http://{ip}:{port}{url_end}添加到扫描列表")
+        return ip_configs
+    except Exception as e:
+        print(f"读取文件错误: {e}")
+        return []
+
+# 扫描范围用整数区间表示：(a.b前缀, 第三段range, 第四段range)
+# x_values为规划器给出的第三段列表（见plan_scan），用于跳过已被其他规则覆盖的C段
+def ip_port_ranges(ip, option, x_values=None):
+    a, b, c, d = ip.split('.')
+    if x_values is not None:
+        return f"{a}.{b}", x_values, range(1, 256)
+    if option == 2 or option == 12:
+        c_extent = c.split('-')
+        c_first = int(c_extent[0]) if len(c_extent) == 2 else int(c)
+        c_last = int(c_extent[1]) + 1 if len(c_extent) == 2 else int(c) + 8
+        return f"{a}.{b}", range(c_first, c_last), range(1, 256)
+    elif option == 0 or option == 10:
+        return f"{a}.{b}", range(int(c), int(c) + 1), range(1, 256)
+    else:  # option=11 全网段扫描
+        return f"{a}.{b}", range(256), range(1, 256)
+
+def count_ip_ports(ip, option, x_values=None):
+    _, x_range, y_range = ip_port_ranges(ip, option, x_values)
+    return len(x_range) * len(y_range)
+
+# 惰性生成待扫描地址，不再一次性构造6万多个字符串
+def generate_ip_ports(ip, port, option, x_values=None, history=None):
+    prefix, x_range, y_range = ip_port_ranges(ip, option, x_values)
+    # 规则11首个命中即停：有历史记录时按命中可能性排序探测顺序
+    if option == 11 and history:
+        yield from history_ordered_ip_ports(prefix, port, x_range, y_range, history)
+        return
+    # 按第四段交错遍历各C段：相邻目标落在不同的/24，按网段限速时并发探测不会都排队等同一个C段
+    for y in y_range:
+        for x in x_range:
+            yield f"{prefix}.{x}.{y}:{port}"
+
+# 从历史位图中统计：本B段曾存活的C段，以及本省常见的udpxy主机号（第四段）
+def history_order(history, prefix, port):
+    hot_xs = collections.Counter()
+    common_ys = collections.Counter()
+    for (hist_prefix, hist_port), bits in history.items():
+        for index in livedb.bitmap_indexes(bits):
+            common_ys[index & 0xff] += 1
+            if hist_prefix == prefix and hist_port == port:
+                hot_xs[index >> 8] += 1
+    return [x for x, _ in hot_xs.most_common()], [y for y, _ in common_ys.most_common(HOT_HOST_OCTETS)]
+
+# 历史引导的探测顺序：先扫曾存活的C段，再扫其余C段的常见主机号，最后按跳跃置换遍历剩余地址
+# 置换用 i -> (i*stride + offset) mod n，不需要生成整张列表，内存恒定
+def history_ordered_ip_ports(prefix, port, x_range, y_range, history):
+    hot_xs, common_ys = history_order(history, prefix, port)
+    x_set = set(x_range)
+    hot_xs = [x for x in hot_xs if x in x_set]
+    common_ys = [y for y in common_ys if y in y_range]
+    hot_x_set, common_y_set = set(hot_xs), set(common_ys)
+    for y in common_ys + [y for y in y_range if y not in common_y_set]:
+        for x in hot_xs:
+            yield f"{prefix}.{x}.{y}:{port}"
+    rest_xs = [x for x in x_range if x not in hot_x_set]
+    for y in common_ys:
+        for x in rest_xs:
+            yield f"{prefix}.{x}.{y}:{port}"
+    rest_ys = [y for y in y_range if y not in common_y_set]
+    n = len(rest_xs) * len(rest_ys)
+    if n == 0:
+        return
+    stride = int(n * 0.6180339887) | 1
+    while math.gcd(stride, n) != 1:
+        stride += 2
+    for i in range(n):
+        index = (i * stride + n // 2) % n
+        x, y = rest_xs[index // len(rest_ys)], rest_ys[index % len(rest_ys)]
+        yield f"{prefix}.{x}.{y}:{port}"
+
+# 把连续的第三段合并成区间：[1,2,3,7] -> [(1,3),(7,7)]
+def coalesce_ranges(values):
+    ranges = []
+    for x in sorted(values):
+        if ranges and x == ranges[-1][1] + 1:
+            ranges[-1][1] = x
+        else:
+            ranges.append([x, x])
+    return [(first, last) for first, last in ranges]
+
+# 扫描规划：合并同一(a.b, 端口, url_end)下所有配置行，输出互不重叠的扫描组，保证每个ip:port只探测一次
+# scanned为本次运行已扫描过的C段 {(a.b, 第三段, 端口, url_end): [有效ip_port]}，跨省份共用时可跳过重复C段
+def plan_scan(configs, scanned=None):
+    scanned = scanned if scanned is not None else {}
+    full_scans = {}   # 整段扫描（规则0/2/10/12）：按C段取并集
+    first_hits = set()  # 规则11：同一B段只保留一组
+    for ip, port, option, url_end in configs:
+        prefix, x_range, _ = ip_port_ranges(ip, option)
+        key = (prefix, port, url_end)
+        if option == 11:
+            first_hits.add(key)
+        else:
+            full_scans.setdefault(key, set()).update(x_range)
+    plan = []
+    for (prefix, port, url_end), xs in sorted(full_scans.items()):
+        option = 10 if url_end == "/status" else 0
+        xs = [x for x in xs if (prefix, x, port, url_end) not in scanned]
+        for first, last in coalesce_ranges(xs):
+            if first == last:
+                plan.append((f"{prefix}.{first}.1", port, option, url_end, None))
+            else:
+                plan.append((f"{prefix}.{first}-{last}.1", port, option + 2, url_end, None))
+    for prefix, port, url_end in sorted(first_hits):
+        # 规则11跳过已整段扫描的C段，首个命中即停的语义不变
+        covered = full_scans.get((prefix, port, url_end), set())
+        covered |= {x for x in range(256) if (prefix, x, port, url_end) in scanned}
+        x_values = tuple(x for x in range(256) if x not in covered) if covered else None
+        if x_values == ():
+            continue
+        plan.append((f"{prefix}.1.1", port, 11, url_end, x_values))
+    return plan
+
+# 记录整段扫描结果，后续规则/省份命中相同C段时直接复用
+def record_scanned(scanned, ip, port, option, url_end, scan_result):
+    prefix, x_range, _ = ip_port_ranges(ip, option)
+    for x in x_range:
+        scanned[(prefix, x, port, url_end)] = []
+    for ip_port in scan_result:
+        x = int(ip_port.split(':')[0].split('.')[2])
+        scanned[(prefix, x, port, url_end)].append(ip_port)
+
+# 从已扫描C段中取出本省配置覆盖范围内的结果
+# 规则11的扫描组会跳过已扫描的C段，这些C段里的命中按C段顺序取第一个补给本省（首个命中即停）；
+# results（本省已有结果）或整段扫描结果里已有同一B段的ip_port时规则11已经满足，不再补
+def reuse_scanned(scanned, configs, results=()):
+    reused = []
+    for ip, port, option, url_end in configs:
+        if option == 11:
+            continue
+        prefix, x_range, _ = ip_port_ranges(ip, option)
+        for x in x_range:
+            reused.extend(scanned.get((prefix, x, port, url_end), []))
+    for ip, port, option, url_end in configs:
+        if option != 11:
+            continue
+        prefix, x_range, _ = ip_port_ranges(ip, option)
+        if any(in_group(ip_port, prefix, port) for ip_port in itertools.chain(results, reused)):
+            continue
+        hit = next((hits[0] for hits in (scanned.get((prefix, x, port, url_end)) for x in x_range) if hits), None)
+        if hit is not None:
+            reused.append(hit)
+    return reused
+
+def in_group(ip_port, prefix, port):
+    """ip_port是否属于 a.b 前缀 + 端口 这一组"""
+    return ip_port.startswith(f"{prefix}.") and ip_port.endswith(f":{port}")
+
+# 核心优化：移除开头冗余检测，保留首匹配即停核心逻辑，减少线程内开销
+def check_ip_port(ip_port, url_end, option, stop_flag, found_ip, ip_lock, progress_stop_event, controller=None):    
+    start, error = time.monotonic(), None
+    try:
+        url = f"http://{ip_port}{url_end}"
+        # 保留海外适配的网络配置，超时3秒适配网络延迟；自适应超时开启时按网段RTT调整
+        timeout = 3
+        if ADAPTIVE_TIMEOUT:
+            host = ip_port.rsplit(':', 1)[0]
+            timeout = (rtt_connect.timeout(host, timeout), rtt_read.timeout(host, timeout))
+        with httpclient.get(url, timeout=timeout, deadline=start + PROBE_MAX_TIME,
+                            verify=False, allow_redirects=False, stream=True) as resp:
+            rtt_read.record(ip_port.rsplit(':', 1)[0], resp.elapsed.total_seconds())
+            resp.raise_for_status()
+            page = read_status_page(resp, start + PROBE_MAX_TIME)
+        if page is not None:
+            print(f"{url} 访问成功")
+            record_load(ip_port, page)
+            # 规则11专属：找到第一个有效IP立即触发停止信号
+            if option == 11:
+                with ip_lock:
+                    found_ip[0] = ip_port  # 加锁保证线程安全，避免数据污染
+                stop_flag.set()  # 标记扫描停止
+                progress_stop_event.set()  # 终止进度打印线程
+            return ip_port
+    except Exception as e:
+        # 开启TCP预筛时到这里的主机端口都已开放，连接超时也算拥塞信号
+        error = autotune.classify_error(e, True if TCP_PREFILTER else None)
+        return None
+    finally:
+        # 把耗时和错误类型反馈给并发控制器
+        if controller is not None:
+            controller.record(time.monotonic() - start, error)
+
+# 流式读取状态页：PROBE_MAX_BYTES内没有udpxy标记返回None，超过截止时间抛出DeadlineExceeded
+# 看到标记后（STATUS_LOAD开启时）继续读到页尾或STATUS_MAX_BYTES，此后的超时/断开只是少读负载，不影响命中
+def read_status_page(resp, deadline):
+    data = b""
+    found = False
+    try:
+        for chunk in httpclient.iter_content(resp, deadline, 1024):
+            data += chunk
+            if not found:
+                found = any(marker in data for marker in UDPXY_MARKERS)
+                if found and not STATUS_LOAD:
+                    break
+                if not found and len(data) >= PROBE_MAX_BYTES:
+                    break
+            elif len(data) >= STATUS_MAX_BYTES:
+                break
+    except OSError:  # requests的异常都是OSError的子类
+        if not found:
+            raise
+    return data if found else None
+
+# 解析udpxy状态页：客户端数取“Active clients”一栏，没有时按Throughput表格的行数计；
+# 带宽为各客户端Throughput之和（Mbit/s）；运行时长只在页面带有Uptime时给出（秒）
+THROUGHPUT_UNITS = {"": 1e-6, "k": 1e-3, "m": 1.0, "g": 1e3}
+def parse_udpxy_status(page):
+    text = page.decode("utf-8", errors="ignore")
+    rows = [[re.sub(r"<[^>]+>", "", cell).strip() for cell in re.findall(r"<t[dh][^>]*>(.*?)</t[dh]>", row, re.S | re.I)]
+            for row in re.findall(r"<tr[^>]*>(.*?)</tr>", text, re.S | re.I)]
+    clients = None
+    throughputs = []
+    column = None
+    for index, row in enumerate(rows):
+        lowered = [cell.lower() for cell in row]
+        if "active clients" in lowered and index + 1 < len(rows):
+            position, following = lowered.index("active clients"), rows[index + 1]
+            if position < len(following) and following[position].isdigit():
+                clients = int(following[position])
+        if "throughput" in lowered:
+            column = lowered.index("throughput")
+        elif column is not None and len(row) > column:
+            match = re.match(r"([\d.]+)\s*([kmg]?)(b|B)", row[column], re.I)
+            if match:
+                value = float(match.group(1)) * THROUGHPUT_UNITS[match.group(2).lower()]
+                throughputs.append(value * 8 if match.group(3) == "B" else value)
+    if clients is None:
+        match = re.search(r"clients\W+(\d+)", re.sub(r"<[^>]+>", " ", text), re.I)
+        clients = int(match.group(1)) if match else (len(throughputs) if column is not None else None)
+    uptime = None
+    match = re.search(r"uptime\W+(?:(\d+)\s*days?\W*)?(\d+):(\d+):(\d+)", re.sub(r"<[^>]+>", " ", text), re.I)
+    if match:
+        days, hours, minutes, seconds = (int(value or 0) for value in match.groups())
+        uptime = days * 86400 + hours * 3600 + minutes * 60 + seconds
+    return {"clients": clients, "mbps": round(sum(throughputs), 3) if throughputs else None, "uptime": uptime}
+
+def record_load(ip_port, page):
+    if STATUS_LOAD:
+        server_loads[ip_port] = parse_udpxy_status(page)
+
+# asyncio引擎：直接用socket发送HTTP请求，判断逻辑与check_ip_port一致
+# 连接阶段使用短超时（即TCP预筛），连上之后才按timeout等待HTTP响应，规则11可边筛边命中
+async def async_check_ip_port(ip_port, url_end, timeout=3, controller=None):
+    host, port = ip_port.rsplit(':', 1)
+    connect_timeout = CONNECT_TIMEOUT if TCP_PREFILTER else timeout
+    if ADAPTIVE_TIMEOUT:
+        connect_timeout = rtt_connect.timeout(host, connect_timeout)
+        timeout = rtt_read.timeout(host, timeout)
+    writer = None
+    start, error = time.monotonic(), None
+    try:
+        reader, writer = await timed_open_connection(host, port, connect_timeout)
+        request = f"GET {url_end} HTTP/1.0\r\nHost: {ip_port}\r\nConnection: close\r\n\r\n"
+        writer.write(request.encode())
+        await writer.drain()
+        sent = time.monotonic()
+        deadline = sent + PROBE_MAX_TIME
+        data = b""
+        found = False
+        limit = PROBE_MAX_BYTES
+        while len(data) < limit:
+            try:
+                chunk = await asyncio.wait_for(reader.read(limit - len(data)),
+                                               min(timeout, max(0, deadline - time.monotonic())))
+            except (asyncio.TimeoutError, OSError):
+                # 命中标记后读不完状态页只是少了负载数据
+                if found:
+                    break
+                raise
+            if not chunk:
+                break
+            if not data:
+                rtt_read.record(host, time.monotonic() - sent)
+            data += chunk
+            if not found and any(marker in data for marker in UDPXY_MARKERS):
+                found = True
+                if not STATUS_LOAD:
+                    break
+                limit = STATUS_MAX_BYTES
+        # 与requests的raise_for_status+allow_redirects=False保持一致：只接受2xx
+        status_line = data.split(b"\r\n", 1)[0].split()
+        if len(status_line) < 2 or not status_line[1].startswith(b"2"):
+            return None
+        if found:
+            print(f"http://{ip_port}{url_end} 访问成功")
+            record_load(ip_port, data.split(b"\r\n\r\n", 1)[-1])
+            return ip_port
+    except Exception as e:
+        # 连接阶段超时是扫描空地址的常态，不算拥塞；连上之后的超时才算
+        error = autotune.classify_error(e, writer is not None)
+        return None
+    finally:
+        if writer is not None:
+            writer.close()
+        if controller is not None:
+            controller.record(time.monotonic() - start, error)
+    return None
+
+def async_concurrency_limit(concurrency):
+    # 每个探测占用一个文件描述符，预留一部分给日志/文件读写
+    try:
+        import resource
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if soft != resource.RLIM_INFINITY:
+            return max(1, min(concurrency, soft - 64))
+    except (ImportError, ValueError):
+        pass
+    return concurrency
+
+# 建立连接并记录网段RTT：连接成功和被拒绝（RST）的耗时都是一次完整往返
+async def timed_open_connection(host, port, timeout):
+    start = time.monotonic()
+    try:
+        connection = await asyncio.wait_for(asyncio.open_connection(host, int(port)), timeout)
+    except ConnectionRefusedError:
+        rtt_connect.record(host, time.monotonic() - start)
+        raise
+    rtt_connect.record(host, time.monotonic() - start)
+    return connection
+
+# 线程池引擎的第一阶段：只建立TCP连接不发请求，连接成功即关闭
+async def async_tcp_connect(ip_port, timeout=CONNECT_TIMEOUT, controller=None):
+    host, port = ip_port.rsplit(':', 1)
+    if ADAPTIVE_TIMEOUT:
+        timeout = rtt_connect.timeout(host, timeout)
+    start, error = time.monotonic(), None
+    try:
+        _, writer = await timed_open_connection(host, port, timeout)
+    except Exception as e:
+        error = autotune.classify_error(e, connected=False)
+        return False
+    finally:
+        if controller is not None:
+            controller.record(time.monotonic() - start, error)
+    writer.close()
+    return True
+
+# 协程引擎的并发控制器：协程数按上限创建，真正在途的探测数由控制器的limit决定
+def async_controller(name, concurrency):
+    maximum = async_concurrency_limit(concurrency)
+    return autotune.AIMDController(name, min(ASYNC_INITIAL_CONCURRENCY, maximum), maximum=maximum)
+
+async def async_prefilter_ip_ports(ip_ports, total, concurrency=ASYNC_CONCURRENCY):
+    open_ip_ports = []
+    targets = enumerate(ip_ports)
+
+    controller = async_controller("TCP预筛", concurrency)
+
+    async def worker():
+        for index, ip_port in targets:
+            async with controller.slot():
+                is_open = await async_tcp_connect(ip_port, controller=controller)
+            if is_open:
+                open_ip_ports.append((index, ip_port))
+
+    concurrency = async_concurrency_limit(min(concurrency, total))
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    # 保持原有扫描顺序，规则11仍按顺序命中第一个
+    result = [ip_port for _, ip_port in sorted(open_ip_ports)]
+    print(f"TCP预筛完成：{len(result)}/{total}个地址端口开放")
+    return result
+
+# stop_file：分片扫描时其他进程命中规则11后写入的标记文件，出现即停止本组扫描
+async def async_scan_ip_port(ip, port, option, url_end, x_values=None, history=None, concurrency=ASYNC_CONCURRENCY,
+                             stop_file=None):
+    valid_ip_ports = []
+    total = count_ip_ports(ip, option, x_values)
+    if not total:
+        print(f"⚠️  未生成待扫描IP（{ip}:{port}）")
+        return valid_ip_ports
+    entry = (ip, port, option, url_end, x_values)
+    path = checkpoint_path(entry, history)
+    start, valid_ip_ports = load_checkpoint(path)
+    if option == 11 and valid_ip_ports:
+        clear_checkpoint(path)
+        return valid_ip_ports[:1]
+    # 所有协程共用一个迭代器取任务，内存只与并发数有关，不随任务数增长
+    targets = itertools.islice(enumerate(generate_ip_ports(ip, port, option, x_values, history)), start, None)
+    stop_flag = asyncio.Event()
+    checked = [start]
+    issued = [start]
+    inflight = set()
+    controller = async_controller("组播扫描", concurrency)
+
+    async def worker():
+        for index, ip_port in targets:
+            if stop_flag.is_set():
+                return
+            issued[0] = index + 1
+            inflight.add(index)
+            try:
+                async with controller.slot():
+                    result = await async_check_ip_port(ip_port, url_end, controller=controller)
+            finally:
+                inflight.discard(index)
+            checked[0] += 1
+            if result and not stop_flag.is_set():
+                valid_ip_ports.append(result)
+                # 规则11专属：找到第一个有效IP立即触发停止信号
+                if option == 11:
+                    stop_flag.set()
+                    return
+
+    async def show_progress():
+        while True:
+            await asyncio.sleep(CHECKPOINT_INTERVAL)
+            save_checkpoint(path, entry, checkpoint_done(issued[0], inflight), valid_ip_ports)
+            if option % 2 == 1:
+                print(f"已扫描：{checked[0]}/{total}, 有效ip_port：{len(valid_ip_ports)}个")
+
+    concurrency = async_concurrency_limit(min(concurrency, total))
+    workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+    async def watch_stop_file():
+        while stop_file:
+            if os.path.exists(stop_file):
+                stop_flag.set()
+                return
+            await asyncio.sleep(1)
+
+    stop_task = asyncio.create_task(stop_flag.wait())
+    progress_task = asyncio.create_task(show_progress())
+    watch_task = asyncio.create_task(watch_stop_file())
+    completed = False
+    try:
+        await asyncio.wait([asyncio.gather(*workers, return_exceptions=True), stop_task],
+                           return_when=asyncio.FIRST_COMPLETED)
+        completed = True
+    finally:
+        # 规则11命中后取消所有在途探测，连接随协程取消一起关闭
+        done = checkpoint_done(issued[0], inflight)
+        for task in workers + [stop_task, progress_task, watch_task]:
+            task.cancel()
+        await asyncio.gather(*workers, stop_task, progress_task, watch_task, return_exceptions=True)
+        # 正常结束删除断点；被中断（Ctrl+C/任务取消）时保存断点
+        if completed:
+            clear_checkpoint(path)
+        else:
+            save_checkpoint(path, entry, done, valid_ip_ports)
+
+    valid_ip_ports = list(dict.fromkeys(valid_ip_ports))
+    if option == 11:
+        valid_ip_ports = valid_ip_ports[:1]
+    return valid_ip_ports
+
+# 断点文件按扫描组参数命名；探测顺序受历史位图影响，历史变化后旧断点自动失效
+def checkpoint_path(entry, history=None):
+    digest = hashlib.md5(repr((CHECKPOINT_VERSION, entry)).encode())
+    for key, bits in sorted((history or {}).items()):
+        digest.update(repr(key).encode() + bits.to_bytes(8192, "little"))
+    return os.path.join(CHECKPOINT_DIR, f"{digest.hexdigest()[:16]}.json")
+
+# 返回 (已完成的探测序号, 已找到的结果)，非续扫模式或无断点时从头开始
+def load_checkpoint(path):
+    if not RESUME or not os.path.exists(path):
+        return 0, []
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        print(f"从断点继续：已完成{data['done']}个探测，已找到{len(data['results'])}个有效ip_port")
+        return data["done"], data["results"]
+    except Exception as e:
+        print(f"读取断点文件错误: {e}")
+        return 0, []
+
+# 先写临时文件再替换，进程中途被杀也不会留下半个断点文件
+def save_checkpoint(path, entry, done, results):
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    with open(f"{path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump({"entry": repr(entry), "done": done, "results": results}, f, ensure_ascii=False)
+    os.replace(f"{path}.tmp", path)
+
+def clear_checkpoint(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+# 断点位置取"低水位"：小于该序号的探测全部完成，在途的探测续扫时重新探测
+def checkpoint_done(issued, inflight):
+    return min(inflight) if inflight else issued
+
+# 核心优化：恢复300并发数、批量检测停止信号、简化进度判断，拉满扫描速度
+def scan_ip_port(ip, port, option, url_end, x_values=None, history=None):
+    if SCAN_ENGINE == "asyncio":
+        return asyncio.run(async_scan_ip_port(ip, port, option, url_end, x_values, history))
+    # 每次扫描独立创建状态，彻底隔离，避免多省份扫描状态污染
+    stop_flag = Event()
+    found_ip = [None]
+    ip_lock = Lock()
+    progress_stop_event = Event()
+    
+    # 优化进度打印：简化判断条件，减少循环内开销，保留精准终止
+    def show_progress(checked, total, stop_flag, progress_stop_event):
+        while not progress_stop_event.is_set() and checked[0] < total and option % 2 == 1:
+            count = 1 if found_ip[0] else 0
+            print(f"已扫描：{checked[0]}/{total}, 有效ip_port：{count}个")
+            # 每1秒检测一次终止信号，保证快速停止
+            for _ in range(30):
+                if progress_stop_event.is_set() or stop_flag.is_set():
+                    return
+                time.sleep(1)
+    
+    valid_ip_ports = []
+    total = count_ip_ports(ip, option, x_values)
+    if not total:
+        print(f"⚠️  未生成待扫描IP（{ip}:{port}）")
+        return valid_ip_ports
+    ip_ports = generate_ip_ports(ip, port, option, x_values, history)
+    # 先做TCP连接预筛，线程池只对端口开放的地址发HTTP请求
+    if TCP_PREFILTER:
+        ip_ports = asyncio.run(async_prefilter_ip_ports(ip_ports, total))
+        if not ip_ports:
+            return valid_ip_ports
+        total = len(ip_ports)
+    
+    checked = [0]
+    # 启动进度打印线程，后台运行不阻塞主扫描
+    progress_thread = Thread(target=show_progress, args=(checked, total, stop_flag, progress_stop_event), daemon=True)
+    progress_thread.start()
+    
+    # 起步并发沿用300/150，之后由AIMD控制器按超时/延迟在[1, THREAD_MAX_WORKERS]内自动调整
+    controller = autotune.AIMDController("组播扫描", 300 if option % 2 == 1 else 150, maximum=THREAD_MAX_WORKERS)
+    executor = ThreadPoolExecutor(max_workers=controller.maximum)
+    # 在途任务窗口等于控制器当前并发，完成一个补一个，内存不随网段大小增长
+    targets = iter(ip_ports)
+    futures = set()
+    
+    def submit_next():
+        # 规则11：检测到停止信号立即停止提交新任务
+        while len(futures) < controller.limit and not (option == 11 and stop_flag.is_set()):
+            ip_port = next(targets, None)
+            if ip_port is None:
+                return
+            futures.add(executor.submit(
+                check_ip_port, 
+                ip_port, url_end, option, 
+                stop_flag, found_ip, ip_lock, progress_stop_event, controller
+            ))
+    
+    try:
+        submit_next()
+        while futures:
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            futures.difference_update(done)
+            for future in done:
+                try:
+                    result = future.result()
+                    if result:
+                        valid_ip_ports.append(result)
+                except Exception as e:
+                    pass
+                checked[0] += 1
+            # 规则11：找到有效IP后快速清理剩余任务，立即退出
+            if option == 11 and stop_flag.is_set():
+                progress_stop_event.set()
+                break
+            submit_next()
+    finally:
+        # 强制关闭线程池，取消未执行任务，防止资源泄漏
+        executor.shutdown(wait=False, cancel_futures=True)
+        progress_stop_event.set()
+        progress_thread.join(timeout=2)  # 等待进度线程退出，无残留
+    
+    # 规则11专属：只保留第一个有效IP，保证结果唯一性
+    if option == 11:
+        if found_ip[0] and found_ip[0] not in valid_ip_ports:
+            valid_ip_ports = [found_ip[0]]
+        valid_ip_ports = valid_ip_ports[:1]
+    
+    # 清理状态，防止内存泄漏
+    stop_flag.clear()
+    progress_stop_event.clear()
+    return valid_ip_ports
+
+# 判断ip_port是否仍在当前配置的扫描范围内，配置删改后旧主机不再复检
+def config_covers(configs, ip_port, url_end):
+    ip, port = ip_port.split(':')
+    a, b, c, d = ip.split('.')
+    for config_ip, config_port, option, config_url_end in configs:
+        if config_port != port or config_url_end != url_end:
+            continue
+        prefix, x_range, _ = ip_port_ranges(config_ip, option)
+        if prefix == f"{a}.{b}" and int(c) in x_range:
+            return True
+    return False
+
+# 复检存活记录库中的历史有效ip_port，按最久未检查优先
+# 返回 (仍存活的ip_port列表, 是否需要整段扫描)
+async def async_verify_known(db, province, configs, concurrency=ASYNC_CONCURRENCY, controller=None):
+    known = [(ip_port, url_end) for ip_port, url_end in livedb.known_hosts(db, province)
+             if config_covers(configs, ip_port, url_end)]
+    if not known:
+        return [], True
+    if controller is None:
+        controller = async_controller(f"{province}复检", concurrency)
+
+    async def verify(ip_port, url_end):
+        async with controller.slot():
+            return await async_check_ip_port(ip_port, url_end, controller=controller)
+
+    results = await asyncio.gather(*(verify(ip_port, url_end) for ip_port, url_end in known))
+    alive = [item for item, result in zip(known, results) if result]
+    dead = [item for item, result in zip(known, results) if not result]
+    livedb.record_checks(db, province, alive, dead)
+    need_sweep = livedb.need_sweep(db, province, len(known), len(alive))
+    print(f"{province}：复检历史有效ip_port {len(alive)}/{len(known)}个存活，{'需要' if need_sweep else '无需'}整段扫描")
+    return [ip_port for ip_port, _ in alive], need_sweep
+
+def print_scan_result(option, scan_result):
+    if scan_result:
+        if option == 11:
+            print(f"✅ 规则{option}找到第一个有效IP：{scan_result[0]}，停止当前组扫描")
+        else:
+            print(f"✅ 规则{option}扫描完成，找到{len(scan_result)}个有效IP")
+    else:
+        print(f"❌ 规则{option}未找到有效IP")
+
+def multicast_province(config_file, scanned=None, db=None):
+    filename = os.path.basename(config_file)
+    province = filename.split('_')[0]
+    print(f"\n{'='*50}")
+    print(f"开始扫描配置文件：{config_file}")
+    print(f"{'='*50}")
+    print(f"{'='*25}\n   获取: {province}ip_port\n{'='*25}")
+    configs = sorted(set(read_config(config_file)))
+    verified = []
+    if db is not None:
+        verified, need_sweep = asyncio.run(async_verify_known(db, province, configs))
+        if not need_sweep:
+            save_province_results(province, verified, db)
+            return
+    scanned = scanned if scanned is not None else {}
+    # 合并重叠网段，已在其他省份扫描过的C段直接复用结果
+    reused = reuse_scanned(scanned, configs, verified)
+    all_ip_ports = verified + reused
+    history = livedb.history_bitmaps(db, province) if db is not None else None
+    # 已从其他省份的扫描结果拿到命中的规则11扫描组不必再扫
+    plan = [(ip, port, option, url_end, x_values) for ip, port, option, url_end, x_values in plan_scan(configs, scanned)
+            if option != 11 or not any(in_group(ip_port, ip_port_ranges(ip, option)[0], port) for ip_port in reused)]
+    print(f"读取完成，共{len(configs)}组配置，合并后需扫描 {len(plan)}组")
+    
+    for ip, port, option, url_end, x_values in plan:
+        print(f"\n开始扫描  http://{ip}:{port}{url_end} (规则{option})")
+        scan_result = scan_ip_port(ip, port, option, url_end, x_values, history)
+        if option != 11:
+            record_scanned(scanned, ip, port, option, url_end, scan_result)
+        if db is not None:
+            livedb.record_checks(db, province, [(ip_port, url_end) for ip_port in scan_result], [])
+        all_ip_ports.extend(scan_result)
+        print_scan_result(option, scan_result)
+    
+    if db is not None:
+        livedb.record_sweep(db, province)
+    save_province_results(province, all_ip_ports, db)
+
+# 写入省份结果：ip/{province}_ip.txt、存档文件和组播_{province}.txt
+def save_province_results(province, all_ip_ports, db=None):
+    # 结果按/16位图存入快照，与上一次运行对比新增/丢失主机
+    if db is not None:
+        previous = livedb.load_snapshots(db, province, 1)
+        current = livedb.ip_ports_to_bitmaps(set(all_ip_ports))
+        livedb.save_snapshot(db, province, current)
+        if previous:
+            stats = livedb.diff_snapshots(previous[0], current)
+            print(f"{province} 对比上次：新增{stats['added']}个，丢失{stats['lost']}个，"
+                  f"保持{stats['kept']}个，变动率{stats['churn']:.0%}")
+    if len(all_ip_ports) != 0:
+        all_ip_ports = sorted(set(all_ip_ports))
+        print(f"\n{province} 扫描完成，获取有效ip_port共：{len(all_ip_ports)}个\n{all_ip_ports}\n")
+        
+        # 自动创建ip目录，避免首次运行报错
+        if not os.path.exists('ip'):
+            os.makedirs('ip', mode=0o755)
+        
+        # 写入有效IP文件，供后续脚本处理
+        with open(f"ip/{province}_ip.txt", 'w', encoding='utf-8') as f:
+            f.write('\n'.join(all_ip_ports))
+        
+        # 存档IP逻辑，保留历史有效IP
+        if os.path.exists(f"ip/存档_{province}_ip.txt"):
+            with open(f"ip/存档_{province}_ip.txt", 'r', encoding='utf-8') as f:
+                lines = f.readlines()
+            for ip_port in all_ip_ports:
+                ip, port = ip_port.split(":")
+                a, b, c, d = ip.split(".")
+                lines.append(f"{a}.{b}.{c}.1:{port}\n")
+            lines = sorted(set(lines))
+            with open(f"ip/存档_{province}_ip.txt", 'w', encoding='utf-8') as f:
+                f.writelines(lines)
+        
+        # 生成省份组播源文件，适配后续HB/DL/PX脚本
+        template_file = os.path.join('template', f"template_{province}.txt")
+        if os.path.exists(template_file):
+            with open(template_file, 'r', encoding='utf-8') as f:
+                tem_channels = f.read()
+            output = [] 
+            with open(f"ip/{province}_ip.txt", 'r', encoding='utf-8') as f:
+                for line in f:
+                    ip = line.strip()
+                    output.append(tem_channels.replace("ipipip", f"{ip}"))
+            with open(f"组播_{province}.txt", 'w', encoding='utf-8') as f:
+                f.writelines(output)
+        else:
+            print(f"缺少模板文件: {template_file}")
+    else:
+        print(f"\n{province} 扫描完成，未扫描到有效ip_port")
+
+# 全局调度：所有省份的扫描组放进同一个协程池，按轮询交错探测
+# 全局并发受ASYNC_CONCURRENCY限制，同一个/24每秒最多SUBNET_RATE个探测，某省的扫描组全部完成就立即写出该省文件
+async def async_scan_provinces(config_files, db=None, concurrency=ASYNC_CONCURRENCY, subnet_rate=SUBNET_RATE,
+                               time_budget=TIME_BUDGET):
+    owners = {}  # 已分配的C段 -> 负责扫描的任务序号，保证跨省重叠C段只扫一次
+    scanned = {}
+    jobs = []
+    provinces = []
+    province_configs = [(os.path.basename(config_file).split('_')[0], sorted(set(read_config(config_file))))
+                        for config_file in config_files]
+    # 复检和扫描共用一个并发控制器，所有省份的探测合计不超过同一个上限
+    controller = async_controller("全局扫描", concurrency)
+    # 先并发复检所有省份的历史有效ip_port，覆盖率足够的省份直接出结果
+    if db is not None:
+        checks = await asyncio.gather(*(async_verify_known(db, province, configs, controller=controller)
+                                        for province, configs in province_configs))
+    else:
+        checks = [([], True)] * len(province_configs)
+    for (province, configs), (verified, need_sweep) in zip(province_configs, checks):
+        if not need_sweep:
+            provinces.append({"province": province, "configs": configs, "pending": set(),
+                              "results": verified, "sweep": False})
+            continue
+        if not MERGE_PROVINCES:
+            owners = {}
+        # 规则11扫描组同样依赖负责其已排除C段的任务，省份完成时由reuse_scanned补回这些C段的命中
+        deps = set()
+        for ip, port, option, url_end in configs:
+            prefix, x_range, _ = ip_port_ranges(ip, option)
+            deps.update(owners[(prefix, x, port, url_end)] for x in x_range
+                        if (prefix, x, port, url_end) in owners)
+        history = livedb.history_bitmaps(db, province) if db is not None else None
+        plan = plan_scan(configs, owners)
+        state = {"province": province, "configs": configs, "pending": set(),
+                 "results": verified, "sweep": True}
+        for ip, port, option, url_end, x_values in plan:
+            # 规则11的x_values取决于本次哪些省份需要整段扫描（owners），每次运行可能不同：
+            # 断点只按配置推出的扫描组记录，序号按整个B段编排，排除的C段在生成目标时跳过，续扫位置不受影响
+            group_values = None if option == 11 else x_values
+            path = checkpoint_path((ip, port, option, url_end, group_values), history)
+            start, results = load_checkpoint(path)
+            targets = itertools.islice(enumerate(generate_ip_ports(ip, port, option, group_values, history)), start, None)
+            if option == 11 and x_values is not None:
+                included = set(x_values)
+                targets = ((index, ip_port) for index, ip_port in targets if int(ip_port.split('.')[2]) in included)
+            job = {"entry": (ip, port, option, url_end), "option": option,
+                   "targets": targets,
+                   "total": count_ip_ports(ip, option, x_values),
+                   "checkpoint": path, "issued": start, "inflight": set(),
+                   "exhausted": False, "stopped": option == 11 and bool(results), "finished": False,
+                   "results": results, "provinces": [state]}
+            if option != 11:
+                prefix, x_range, _ = ip_port_ranges(ip, option)
+                for x in x_range:
+                    owners[(prefix, x, port, url_end)] = len(jobs)
+            deps.add(len(jobs))
+            jobs.append(job)
+        for job_id in deps:
+            if state not in jobs[job_id]["provinces"]:
+                jobs[job_id]["provinces"].append(state)
+        state["pending"] = deps
+        provinces.append(state)
+        print(f"{province}：共{len(configs)}组配置，合并后需扫描 {len(plan)}组")
+
+    def finish_province(state):
+        results = state["results"]
+        if state["sweep"]:
+            results = results + reuse_scanned(scanned, state["configs"], results)
+            if db is not None:
+                livedb.record_sweep(db, state["province"])
+        save_province_results(state["province"], results, db)
+
+    def finish_job(job_id):
+        job = jobs[job_id]
+        job["finished"] = True
+        clear_checkpoint(job["checkpoint"])
+        job["results"] = list(dict.fromkeys(job["results"]))
+        ip, port, option, url_end = job["entry"]
+        print(f"\n扫描完成  http://{ip}:{port}{url_end} (规则{option})")
+        print_scan_result(option, job["results"])
+        if option == 11:
+            job["results"] = job["results"][:1]
+        else:
+            record_scanned(scanned, ip, port, option, url_end, job["results"])
+        for state in job["provinces"]:
+            if db is not None:
+                livedb.record_checks(db, state["province"], [(ip_port, url_end) for ip_port in job["results"]], [])
+            if option == 11 and job_id in state["pending"]:
+                state["results"].extend(job["results"])
+            state["pending"].discard(job_id)
+            if not state["pending"]:
+                finish_province(state)
+
+    for state in provinces:
+        if not state["pending"]:
+            finish_province(state)
+    # 断点中已命中的规则11扫描组直接完成
+    for job_id, job in enumerate(jobs):
+        if job["stopped"]:
+            finish_job(job_id)
+
+    active = collections.deque(job_id for job_id, job in enumerate(jobs) if not job["finished"])
+    next_slot = {}
+    checked = [sum(job["issued"] for job in jobs)]
+    total = sum(job["total"] for job in jobs)
+
+    # 同一/24的探测按固定间隔排队，避免集中打满单个网段
+    async def throttle(ip_port):
+        subnet = ip_port.rsplit('.', 1)[0]
+        now = time.monotonic()
+        slot = max(now, next_slot.get(subnet, now))
+        next_slot[subnet] = slot + 1 / subnet_rate
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def next_target():
+        while active:
+            job_id = active.popleft()
+            job = jobs[job_id]
+            if job["stopped"]:
+                continue
+            index, ip_port = next(job["targets"], (None, None))
+            if ip_port is None:
+                job["exhausted"] = True
+                if not job["inflight"]:
+                    finish_job(job_id)
+                continue
+            active.append(job_id)
+            job["issued"] = index + 1
+            job["inflight"].add(index)
+            return job_id, index, ip_port
+        return None, None, None
+
+    def save_checkpoints():
+        for job in jobs:
+            if not job["finished"]:
+                save_checkpoint(job["checkpoint"], job["entry"],
+                                checkpoint_done(job["issued"], job["inflight"]), job["results"])
+
+    deadline = time.monotonic() + time_budget if time_budget else None
+
+    async def worker():
+        while deadline is None or time.monotonic() < deadline:
+            job_id, index, ip_port = next_target()
+            if job_id is None:
+                return
+            job = jobs[job_id]
+            await throttle(ip_port)
+            result = None
+            if not job["stopped"]:
+                async with controller.slot():
+                    result = await async_check_ip_port(ip_port, job["entry"][3], controller=controller)
+            checked[0] += 1
+            job["inflight"].discard(index)
+            if result and not job["stopped"]:
+                job["results"].append(result)
+                # 规则11专属：找到第一个有效IP后该组不再派发新探测
+                if job["option"] == 11:
+                    job["stopped"] = True
+            if (job["exhausted"] or job["stopped"]) and not job["inflight"] and not job["finished"]:
+                finish_job(job_id)
+
+    async def show_progress():
+        while True:
+            await asyncio.sleep(CHECKPOINT_INTERVAL)
+            save_checkpoints()
+            print(f"已扫描：{checked[0]}/{total}, 剩余扫描组：{len(active)}个")
+
+    progress_task = asyncio.create_task(show_progress())
+    try:
+        await asyncio.gather(*(worker() for _ in range(async_concurrency_limit(concurrency))))
+    finally:
+        progress_task.cancel()
+        # 时间预算用完或被中断：保存未完成扫描组的断点，下次用 --resume 继续
+        unfinished = [job for job in jobs if not job["finished"]]
+        if unfinished:
+            save_checkpoints()
+            print(f"\n⏸️  还有{len(unfinished)}组未扫描完，已保存断点，使用 --resume 继续")
+
+# ==================== 分片扫描：shard（拆分） → worker（执行） → merge（合并） ====================
+# 用法：
+#   python zubo.py shard ip/湖北电信_config.txt 8 [本机进程数] [--force]   把扫描计划拆成8片，可选直接在本机起若干worker
+#   python zubo.py worker [ip/shards/湖北电信]                 领取并执行未完成的分片，多台机器可同时运行
+#   python zubo.py merge ip/湖北电信_config.txt                所有分片完成后合并为 ip/湖北电信_ip.txt 和组播文件
+# 重新拆分会清空该省份的分片目录；还有worker在执行（领取标记未超时）时拒绝拆分，确认要放弃正在进行的扫描时加 --force
+SHARD_USAGE = """用法：
+  python zubo.py shard <配置文件> <分片数> [本机进程数] [--force]
+  python zubo.py worker [分片目录]
+  python zubo.py merge <配置文件>"""
+def shard_province_dir(province):
+    return os.path.join(SHARD_DIR, province)
+
+# 按C段轮流分配到各分片（相邻C段落在不同分片，负载更均匀）；规则11按组记录，任一分片命中后其他分片停止该组
+def shard_plan(config_file, shard_count, force=False):
+    province = os.path.basename(config_file).split('_')[0]
+    shard_dir = shard_province_dir(province)
+    running = active_claims(shard_dir)
+    if running and not force:
+        print(f"⚠️  {province}：还有{len(running)}个分片正在执行（领取标记未超时），拒绝重新拆分；确认放弃请加 --force")
+        return None
+    plan = plan_scan(sorted(set(read_config(config_file))))
+    shards = [[] for _ in range(shard_count)]
+    for group, (ip, port, option, url_end, x_values) in enumerate(plan):
+        _, x_range, _ = ip_port_ranges(ip, option, x_values)
+        x_range = list(x_range)
+        for i in range(shard_count):
+            xs = x_range[i::shard_count]
+            if xs:
+                shards[i].append([ip, port, option, url_end, xs, group])
+    os.makedirs(shard_dir, exist_ok=True)
+    for name in os.listdir(shard_dir):
+        os.remove(os.path.join(shard_dir, name))
+    for i, entries in enumerate(shards):
+        with open(os.path.join(shard_dir, f"shard_{i}.json"), 'w', encoding='utf-8') as f:
+            json.dump({"province": province, "shard": i, "count": shard_count, "entries": entries}, f, ensure_ascii=False)
+    print(f"{province}：扫描计划{len(plan)}组，已拆分为{shard_count}个分片 → {shard_dir}")
+    return shard_dir
+
+# 用O_EXCL创建领取标记，多进程/多机共享目录时同一分片只会被一个worker领取；
+# 标记内容为 主机名:进程号:领取时间，修改时间即最近一次心跳
+def claim_shard(shard_file):
+    claim_file = f"{shard_file}.claim"
+    try:
+        fd = os.open(claim_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        if not take_over_claim(claim_file):
+            return False
+        return claim_shard(shard_file)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(f"{socket.gethostname()}:{os.getpid()}:{int(time.time())}")
+    return True
+
+# 领取标记心跳超时（worker崩溃或机器掉线）时移走旧标记，返回True表示可以重新领取
+def take_over_claim(claim_file):
+    stale_file = f"{claim_file}.{socket.gethostname()}.{os.getpid()}"
+    try:
+        with open(claim_file, 'r', encoding='utf-8') as f:
+            owner = f.read()
+        if time.time() - os.path.getmtime(claim_file) < SHARD_CLAIM_TIMEOUT:
+            return False
+        os.rename(claim_file, stale_file)
+    except FileNotFoundError:
+        return True  # 标记已被释放
+    with open(stale_file, 'r', encoding='utf-8') as f:
+        taken = f.read()
+    if taken != owner:
+        # 检查到改名之间已被其他worker接管：把新标记放回去
+        try:
+            os.link(stale_file, claim_file)
+        except FileExistsError:
+            pass
+        os.remove(stale_file)
+        return False
+    os.remove(stale_file)
+    print(f"⚠️  领取标记{claim_file}已{SHARD_CLAIM_TIMEOUT:.0f}秒无心跳（{owner}），接管该分片")
+    return True
+
+# 仍在心跳、分片还没出结果的领取标记
+def active_claims(shard_dir):
+    now = time.time()
+    claims = []
+    for claim_file in glob.glob(os.path.join(shard_dir, 'shard_*.json.claim')):
+        shard_file = claim_file[:-len(".claim")]
+        try:
+            if now - os.path.getmtime(claim_file) < SHARD_CLAIM_TIMEOUT and not os.path.exists(f"{shard_file}.result"):
+                claims.append(claim_file)
+        except FileNotFoundError:
+            pass
+    return claims
+
+def release_claim(claim_file):
+    try:
+        os.remove(claim_file)
+    except FileNotFoundError:
+        pass
+
+def claim_heartbeat(claim_file, stop):
+    while not stop.wait(SHARD_HEARTBEAT):
+        try:
+            os.utime(claim_file)
+        except OSError:
+            return
+
+def run_shard(shard_file):
+    with open(shard_file, 'r', encoding='utf-8') as f:
+        shard = json.load(f)
+    shard_dir = os.path.dirname(shard_file)
+    print(f"\n开始执行分片：{shard_file}（{shard['province']} {shard['shard'] + 1}/{shard['count']}）")
+    results = []
+    for ip, port, option, url_end, xs, group in shard["entries"]:
+        found_file = os.path.join(shard_dir, f"found_{group}")
+        if option == 11 and os.path.exists(found_file):
+            results.append([group, []])
+            continue
+        scan_result = asyncio.run(async_scan_ip_port(ip, port, option, url_end, tuple(xs),
+                                                     stop_file=found_file if option == 11 else None))
+        if option == 11 and scan_result:
+            with open(found_file, 'w', encoding='utf-8') as f:
+                f.write(scan_result[0])
+        print_scan_result(option, scan_result)
+        results.append([group, scan_result])
+    with open(f"{shard_file}.result.tmp", 'w', encoding='utf-8') as f:
+        json.dump({"entries": [[entry[3], entry[2], *result] for entry, result in zip(shard["entries"], results)],
+                   "loads": server_loads}, f, ensure_ascii=False)
+    os.replace(f"{shard_file}.result.tmp", f"{shard_file}.result")
+
+# 不指定目录时领取SHARD_DIR下所有省份的分片
+def shard_worker(shard_dir=None):
+    shard_dirs = [shard_dir] if shard_dir else sorted(glob.glob(os.path.join(SHARD_DIR, '*')))
+    count = 0
+    for directory in shard_dirs:
+        for shard_file in sorted(glob.glob(os.path.join(directory, 'shard_*.json'))):
+            if os.path.exists(f"{shard_file}.result") or not claim_shard(shard_file):
+                continue
+            claim_file = f"{shard_file}.claim"
+            stop = Event()
+            Thread(target=claim_heartbeat, args=(claim_file, stop), daemon=True).start()
+            try:
+                run_shard(shard_file)
+            except BaseException:
+                # 执行失败或被中断时释放领取标记，其他worker可以立即重新领取
+                release_claim(claim_file)
+                raise
+            finally:
+                stop.set()
+            count += 1
+    print(f"\n本worker共完成{count}个分片")
+
+def merge_shards(config_file):
+    province = os.path.basename(config_file).split('_')[0]
+    shard_dir = shard_province_dir(province)
+    shard_files = sorted(glob.glob(os.path.join(shard_dir, 'shard_*.json')))
+    pending = [shard_file for shard_file in shard_files if not os.path.exists(f"{shard_file}.result")]
+    if not shard_files or pending:
+        print(f"⚠️  {province}：还有{len(pending)}/{len(shard_files)}个分片未完成，暂不合并")
+        return False
+    all_ip_ports = []
+    first_hits = {}
+    checks = []
+    loads = {}
+    for shard_file in shard_files:
+        with open(f"{shard_file}.result", 'r', encoding='utf-8') as f:
+            result = json.load(f)
+        loads.update(result.get("loads", {}))
+        for url_end, option, group, scan_result in result["entries"]:
+            # 规则11每组只保留一个命中
+            if option == 11:
+                if scan_result and group not in first_hits:
+                    first_hits[group] = scan_result[0]
+                    checks.append((scan_result[0], url_end))
+            else:
+                all_ip_ports.extend(scan_result)
+                checks.extend((ip_port, url_end) for ip_port in scan_result)
+    all_ip_ports.extend(first_hits.values())
+    db = livedb.open_db() if USE_LIVE_DB else None
+    if db is not None:
+        livedb.record_checks(db, province, checks, [])
+        livedb.record_sweep(db, province)
+        save_server_loads(db, loads)
+    save_province_results(province, all_ip_ports, db)
+    if db is not None:
+        db.close()
+    return True
+
+# 把扫描到的udpxy负载写入存活记录库，供DL.py排序和跳过已满主机
+def save_server_loads(db, loads):
+    if not loads:
+        return
+    livedb.save_loads(db, loads)
+    busiest = sorted(loads.items(), key=lambda item: -(item[1]["clients"] or 0))[:5]
+    print(f"📊 已记录{len(loads)}台udpxy的负载，客户端最多的："
+          + "，".join(f"{ip_port}({load['clients'] if load['clients'] is not None else '?'}个/{load['mbps'] or 0}Mbps)" for ip_port, load in busiest))
+
+def shard_command(args):
+    force = "--force" in args
+    args = [arg for arg in args if arg != "--force"]
+    command = args[0]
+    valid = {"shard": len(args) >= 3 and all(arg.isdigit() and int(arg) > 0 for arg in args[2:4]),
+             "worker": True, "merge": len(args) >= 2}
+    if not valid[command]:
+        print(SHARD_USAGE)
+        sys.exit(2)
+    if command == "shard":
+        shard_dir = shard_plan(args[1], int(args[2]), force)
+        if shard_dir is None:
+            sys.exit(1)
+        # 指定本机进程数时直接起worker，全部结束后自动合并
+        if len(args) > 3:
+            processes = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "worker", shard_dir])
+                         for _ in range(int(args[3]))]
+            for process in processes:
+                process.wait()
+            merge_shards(args[1])
+    elif command == "worker":
+        shard_worker(args[1] if len(args) > 1 else None)
+    elif command == "merge":
+        merge_shards(args[1])
+
+def txt_to_m3u(input_file, output_file):
+    # 把txt格式组播源转为标准m3u格式，兼容各类播放器
+    with open(input_file, 'r', encoding='utf-8') as f:
+        lines = f.readlines()
+    with open(output_file, 'w', encoding='utf-8') as f:
+        genre = ''
+        for line in lines:
+            line = line.strip()
+            if "," in line:
+                channel_name, channel_url = line.split(',', 1)
+                if channel_url == '#genre#':
+                    genre = channel_name
+                else:
+                    f.write(f'#EXTINF:-1 group-title="{genre}",{channel_name}\n')
+                    f.write(f'{channel_url}\n')
+
+def main():
+    # 自动创建ip/template目录，避免首次运行/目录删除后报错
+    for dir_name in ['ip', 'template']:
+        if not os.path.exists(dir_name):
+            os.makedirs(dir_name, mode=0o755)
+    
+    # 检测配置文件，无配置时友好提示并退出
+    config_files = glob.glob(os.path.join('ip', '*_config.txt'))
+    if not config_files:
+        print("⚠️  未找到ip目录下的*_config.txt配置文件，请检查目录和文件命名！")
+        return
+    
+    db = livedb.open_db() if USE_LIVE_DB else None
+    if db is not None:
+        # 上次运行保存的网段RTT，本次样本攒够之前先用它设置超时
+        rtt_connect.known.update(livedb.load_rtt(db, "connect"))
+        rtt_read.known.update(livedb.load_rtt(db, "read"))
+    if SCAN_ENGINE == "asyncio":
+        # 所有省份交给全局调度器同时扫描，总耗时接近最慢的省份
+        asyncio.run(async_scan_provinces(config_files, db))
+    else:
+        # 遍历扫描所有省份配置文件，间隔1秒防止资源未释放
+        # 各省共用已扫描C段记录，跨省重叠的网段只探测一次（ZUBO_MERGE_PROVINCES=0关闭）
+        scanned = {} if MERGE_PROVINCES else None
+        for config_file in config_files:
+            time.sleep(1)
+            multicast_province(config_file, scanned, db)
+    if db is not None:
+        livedb.save_rtt(db, "connect", rtt_connect.estimates())
+        livedb.save_rtt(db, "read", rtt_read.estimates())
+        save_server_loads(db, server_loads)
+        db.close()
+    
+    # 合并电信/联通组播源，生成总文件
+    file_contents = []
+    for file_path in glob.glob('组播_*电信.txt') + glob.glob('组播_*联通.txt'):
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding="utf-8") as f:
+                file_contents.append(f.read())
+    
+    # 生成总组播源txt和m3u文件，记录更新时间
+    now = datetime.datetime.now()
+    current_time = now.strftime("%Y/%m/%d %H:%M")
+    with open("zubo_all.txt", "w", encoding="utf-8") as f:
+        f.write(f"{current_time}更新,#genre#\n")
+        f.write(f"浙江卫视,http://ali-m-l.cztv.com/channels/lantian/channel001/1080p.m3u8\n")
+        f.write('\n'.join(file_contents))
+    
+    # 转换为m3u格式
+    txt_to_m3u("zubo_all.txt", "zubo_all.m3u")
+    print(f"\n🎉 组播地址获取完成，最终生成文件：")
+    print(f"   - 总组播源(TXT)：zubo_all.txt")
+    print(f"   - 总组播源(M3U)：zubo_all.m3u")
+
+if __name__ == "__main__":
+    # 禁用SSL证书警告，让日志更干净，无刷屏干扰
+    import urllib3
+    urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+    if len(sys.argv) > 1 and sys.argv[1] in ("shard", "worker", "merge"):
+        shard_command(sys.argv[1:])
+    else:
+        main()